@@ -0,0 +1,71 @@
+"""下载器配置
+
+配置保存在 data/config.json，缺少的项使用默认值::
+
+    {
+        "scratch_dir": "D:/scratch",
+        "disk_reserve_margin_mb": 512,
+        "retention": {"max_total_gb": 200, "max_age_days": 90, "sweep_interval_minutes": 60},
+        "verify": {"workers": 4, "max_read_mb_per_s": 200, "probe": false},
+        "subscriptions": {"poll_interval_minutes": 60, "max_new_per_poll": 20, "initial_backfill": 3},
+        "content_cache": {"url": "http://192.168.1.10:8765", "timeout": 10}
+    }
+"""
+import json
+import os
+
+CONFIG_FILE = os.path.join('data', 'config.json')
+
+DEFAULT_CONFIG = {
+    # 临时目录（如本地 SSD），分片下载与合并在这里进行，完成后移动到下载目录；为空则直接写入下载目录
+    'scratch_dir': '',
+    # 开始下载前，除预计文件大小外还需保留的磁盘空间
+    'disk_reserve_margin_mb': 512,
+    # 视频库保留策略，0 表示不限制；设置了任一限制时播放器会定期在后台清理
+    'retention': {
+        'max_total_gb': 0,
+        'max_age_days': 0,
+        'sweep_interval_minutes': 60,
+    },
+    # 文件校验：同时检查的文件数、总读取速度上限（0 表示不限制）、是否用 ffprobe 检查能否解码
+    'verify': {
+        'workers': 4,
+        'max_read_mb_per_s': 0,
+        'probe': False,
+    },
+    # 频道订阅：检查间隔、每次最多下载的新视频数、新订阅第一次检查时下载的最新视频数
+    'subscriptions': {
+        'poll_interval_minutes': 60,
+        'max_new_per_poll': 20,
+        'initial_backfill': 3,
+    },
+    # 局域网内容缓存服务地址（见 content_cache.py），为空则不使用
+    'content_cache': {
+        'url': '',
+        'timeout': 10,
+    },
+}
+
+
+def load_config(config_file=CONFIG_FILE):
+    """读取配置，文件不存在或损坏时返回默认配置"""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                user_config = json.load(f)
+            for key, value in user_config.items():
+                # 嵌套的配置项逐项合并，保留未设置项的默认值
+                if isinstance(config.get(key), dict) and isinstance(value, dict):
+                    config[key].update(value)
+                else:
+                    config[key] = value
+        except Exception as e:
+            print(f"读取配置失败: {e}")
+    return config
+
+
+def save_config(config, config_file=CONFIG_FILE):
+    os.makedirs(os.path.dirname(config_file) or '.', exist_ok=True)
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
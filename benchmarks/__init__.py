@@ -0,0 +1,6 @@
+"""性能基准测试
+
+在项目根目录下运行，例如::
+
+    python -m benchmarks.bench_download --output bench_download.json
+"""
@@ -0,0 +1,179 @@
+"""下载器基准测试
+
+针对本地假媒体服务器运行 DownloadJob 的下载逻辑，统计各阶段耗时
+（解析、传输、合并/后处理、.vinfo 写入、历史记录写入）、吞吐量、CPU 时间和内存峰值，
+并在不同并发数下重复，结果写入 JSON 以便在版本之间对比。
+
+用法::
+
+    python -m benchmarks.bench_download --concurrency 1 2 4 --jobs 8 --output bench_download.json
+    python -m benchmarks.bench_download --compare bench_download.json
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import Measure, compare_reports, summarize, write_report
+from benchmarks.fake_media_server import FakeMediaServer
+from download_job import DownloadJob
+from history_store import append_history
+from ydl_pool import ydl_pool
+
+
+class BenchDownloadJob(DownloadJob):
+    """记录各阶段时间点的 DownloadJob"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, on_finished=self.record_finished, on_error=self.record_error, **kwargs)
+        self.marks = {}
+        self.postprocess_s = 0.0
+        self.pp_started = None
+        self.errors = []
+
+    def build_ydl_opts(self):
+        ydl_opts = super().build_ydl_opts()
+        ydl_opts.update({
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+        })
+        return ydl_opts
+
+    def progress_hook(self, d):
+        now = time.perf_counter()
+        if d['status'] == 'downloading':
+            self.marks.setdefault('transfer_start', now)
+        elif d['status'] == 'finished':
+            self.marks.setdefault('transfer_start', now)
+            self.marks['transfer_end'] = now
+        super().progress_hook(d)
+
+    def postprocessor_hook(self, d):
+        super().postprocessor_hook(d)
+        now = time.perf_counter()
+        if d['status'] == 'started':
+            self.pp_started = now
+        elif d['status'] == 'finished' and self.pp_started is not None:
+            self.postprocess_s += now - self.pp_started
+            self.marks['postprocess_end'] = now
+            self.pp_started = None
+
+    def record_finished(self, result):
+        self.marks['vinfo_end'] = time.perf_counter()
+        self.result = result
+
+    def record_error(self, message):
+        self.errors.append(message)
+
+    def phases(self):
+        """根据时间点计算各阶段耗时"""
+        start = self.marks['start']
+        transfer_start = self.marks.get('transfer_start', start)
+        transfer_end = self.marks.get('transfer_end', transfer_start)
+        vinfo_start = max(transfer_end, self.marks.get('postprocess_end', transfer_end))
+        return {
+            'extract': transfer_start - start,
+            'transfer': transfer_end - transfer_start,
+            'postprocess': self.postprocess_s,
+            'vinfo': self.marks.get('vinfo_end', vinfo_start) - vinfo_start,
+        }
+
+
+def run_job(url, download_dir, history_file):
+    """执行一次下载并返回各阶段耗时"""
+    job = BenchDownloadJob([url], download_dir, '1080p')
+    job.marks['start'] = time.perf_counter()
+    job.run()
+    if job.errors:
+        return {'error': job.errors[0]}
+
+    phases = job.phases()
+    # 与下载器、下载服务相同，通过跨进程文件锁追加历史记录，等待锁的时间也计入
+    start = time.perf_counter()
+    append_history(history_file, job.result)
+    phases['history'] = time.perf_counter() - start
+    return phases
+
+
+def run_level(server, scenario, concurrency, jobs, work_dir):
+    """以给定并发数运行一组下载"""
+    level_dir = tempfile.mkdtemp(prefix=f'{scenario}_c{concurrency}_', dir=work_dir)
+    history_file = os.path.join(level_dir, 'history.json')
+    server.reset_bytes()
+
+    with Measure() as measure:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = []
+            for i in range(jobs):
+                job_dir = os.path.join(level_dir, f'job{i}')
+                os.makedirs(job_dir)
+                url = server.url_for(scenario, f'{scenario}_job{i}')
+                futures.append(pool.submit(run_job, url, job_dir, history_file))
+            outcomes = [f.result() for f in futures]
+
+    bytes_sent = server.reset_bytes()
+    errors = [o['error'] for o in outcomes if 'error' in o]
+    succeeded = [o for o in outcomes if 'error' not in o]
+    result = {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'jobs': jobs,
+        'succeeded': len(succeeded),
+        'errors': errors[:5],
+        'bytes': bytes_sent,
+        'bytes_per_s': round(bytes_sent / measure.wall_s, 1) if measure.wall_s else None,
+        'phases': {
+            name: summarize([o[name] for o in succeeded])
+            for name in ('extract', 'transfer', 'postprocess', 'vinfo', 'history')
+        },
+    }
+    result.update(measure.as_dict())
+    shutil.rmtree(level_dir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载器基准测试')
+    parser.add_argument('--scenarios', nargs='+', default=['progressive', 'hls', 'dash'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--jobs', type=int, default=4, help='每个并发级别的下载数量')
+    parser.add_argument('--duration', type=int, default=10, help='合成媒体时长（秒）')
+    parser.add_argument('--output', default='bench_output/bench_download.json')
+    parser.add_argument('--compare', help='与之前的 JSON 结果对比')
+    parser.add_argument('--no-pool', action='store_true', help='不复用 YoutubeDL 实例（用于对比）')
+    args = parser.parse_args()
+
+    if args.no_pool:
+        ydl_pool.max_idle_per_profile = 0
+
+    work_dir = tempfile.mkdtemp(prefix='bench_download_')
+    results = []
+    try:
+        with FakeMediaServer(duration=args.duration) as server:
+            for scenario in args.scenarios:
+                if scenario not in server.scenarios:
+                    print(f'跳过 {scenario}: 需要 ffmpeg')
+                    continue
+                for concurrency in args.concurrency:
+                    result = run_level(server, scenario, concurrency, args.jobs, work_dir)
+                    results.append(result)
+                    print(f"{scenario:12s} c={concurrency:<3d} "
+                          f"{result['succeeded']}/{args.jobs} 成功  "
+                          f"{result['wall_s']:.2f}s  "
+                          f"{(result['bytes_per_s'] or 0) / 1024 / 1024:.2f} MB/s  "
+                          f"cpu={result['cpu_s']:.2f}s")
+    finally:
+        ydl_pool.clear()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = write_report(args.output, 'download', results, {'pool': not args.no_pool})
+    print(f'结果已写入 {args.output}')
+    if args.compare:
+        compare_reports(args.compare, report, ('scenario', 'concurrency'))
+
+
+if __name__ == '__main__':
+    main()
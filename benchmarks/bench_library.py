@@ -0,0 +1,209 @@
+"""播放器视频库与历史记录基准测试
+
+生成合成的下载目录（稀疏视频文件 + .vinfo 文件）和大型 history.json，
+Windows 上通过 FSCTL_SET_SPARSE 把视频文件标记为稀疏文件（NTFS 默认不是稀疏的，
+直接扩展文件大小会真的占用磁盘空间），无法标记时（例如 FAT32/exFAT）文件大小限制为
+NON_SPARSE_MAX_SIZE，排序用的大小会变小，但扫描的文件数不变。
+在 offscreen Qt 平台下统计以下操作的墙钟时间与内存峰值：
+
+    scan            PlayerWindow.load_video_list，包括后台读取 .vinfo 并重新排序
+    sort            按大小、下载日期列排序
+    history_load    HistoryWindow.load_history
+    history_delete  HistoryWindow.delete_history('month')
+
+每个规模在独立子进程中运行，保证峰值 RSS 互不影响。
+
+用法::
+
+    python -m benchmarks.bench_library --sizes 10000 50000 100000
+    python -m benchmarks.bench_library --compare old_bench_library.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.common import Measure, compare_reports, write_report
+
+# 无法创建稀疏文件时每个视频文件的大小上限
+NON_SPARSE_MAX_SIZE = 64 * 1024
+
+FSCTL_SET_SPARSE = 0x000900C4
+
+
+def mark_sparse(f):
+    """把打开的文件标记为稀疏文件，返回之后扩展文件大小是否不占用磁盘空间"""
+    if sys.platform != 'win32':
+        # ext4/APFS 等文件系统扩展文件大小时本身就不分配空间
+        return True
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+    returned = wintypes.DWORD()
+    return bool(ctypes.windll.kernel32.DeviceIoControl(
+        wintypes.HANDLE(msvcrt.get_osfhandle(f.fileno())), FSCTL_SET_SPARSE,
+        None, 0, None, 0, ctypes.byref(returned), None))
+
+
+def generate_library(downloads_dir, count, seed=0):
+    """生成 count 个稀疏视频文件及其 .vinfo 文件"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    os.makedirs(downloads_dir, exist_ok=True)
+    entries = []
+    for i in range(count):
+        download_time = now - timedelta(minutes=rng.randint(0, 60 * 24 * 120))
+        title = f'Synthetic video {i:06d}'
+        timestamp = download_time.strftime("%Y%m%d_%H%M%S")
+        video_path = os.path.join(downloads_dir, f'{title}_{timestamp}.mp4')
+        # 稀疏文件：只设置文件大小，不写入实际数据
+        size = rng.randint(1, 2048) * 1024 * 1024
+        with open(video_path, 'wb') as f:
+            if not mark_sparse(f):
+                size = min(size, NON_SPARSE_MAX_SIZE)
+            f.truncate(size)
+
+        info = {
+            'title': title,
+            'url': f'https://www.youtube.com/watch?v=synthetic{i:06d}',
+            'download_time': download_time.strftime("%Y-%m-%d %H:%M:%S"),
+            'resolution': '1080p',
+            'duration': rng.randint(30, 7200),
+            'format': '137 - 1920x1080 (1080p)+140 - audio only (medium)',
+            'channel': f'Channel {i % 500}',
+            'channel_url': f'https://www.youtube.com/channel/synthetic{i % 500}',
+            'description': 'synthetic ' * 20,
+            'view_count': rng.randint(0, 10 ** 7),
+            'like_count': rng.randint(0, 10 ** 5),
+            'upload_date': download_time.strftime("%Y%m%d"),
+        }
+        with open(video_path.rsplit('.', 1)[0] + '.vinfo', 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+
+        entry = info.copy()
+        entry['file_path'] = video_path
+        entry['vinfo_path'] = video_path.rsplit('.', 1)[0] + '.vinfo'
+        entries.append(entry)
+    return entries
+
+
+def write_history_file(history_file, entries):
+    with open(history_file, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+
+
+def timed(operation):
+    with Measure() as measure:
+        operation()
+    return measure.as_dict()
+
+
+def run_worker(size, work_dir):
+    """在当前进程中运行一个规模的测试，返回结果字典"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import Qt
+    from PyQt6.QtWidgets import QApplication
+    import history_window
+    import video_player
+
+    # 删除历史后会弹出模态提示框，测试中直接跳过
+    history_window.QMessageBox.information = staticmethod(lambda *args, **kwargs: None)
+
+    downloads_dir = os.path.join(work_dir, 'downloads')
+    history_file = os.path.join(work_dir, 'data', 'history.json')
+    os.makedirs(os.path.dirname(history_file), exist_ok=True)
+
+    with Measure() as generate:
+        entries = generate_library(downloads_dir, size)
+        write_history_file(history_file, entries)
+
+    app = QApplication.instance() or QApplication([])
+    os.chdir(work_dir)
+    phases = {}
+
+    player = video_player.PlayerWindow()
+    # 第一次扫描推迟到窗口首次绘制之后（这里窗口不显示），先处理积压的事件，
+    # 万一已经启动了扫描也等它结束，不计入下面的计时
+    app.processEvents()
+    if player.vinfo_loader:
+        player.vinfo_loader.wait()
+    app.processEvents()
+    player.dir_display.setText(downloads_dir)
+
+    def scan():
+        player.load_video_list()
+        # 只等待这一次扫描启动的加载线程
+        loader = player.vinfo_loader
+        if loader:
+            loader.wait()
+        # 处理后台线程排队的 loaded/finished 信号
+        app.processEvents()
+
+    phases['scan'] = timed(scan)
+    phases['sort'] = timed(lambda: (
+        player.video_list.sortByColumn(1, Qt.SortOrder.DescendingOrder),
+        player.video_list.sortByColumn(2, Qt.SortOrder.DescendingOrder),
+    ))
+    player.close()
+
+    history = history_window.HistoryWindow(history_file)
+    phases['history_load'] = timed(history.load_history)
+    phases['history_delete'] = timed(lambda: history.delete_history('month'))
+    history.close()
+
+    return {
+        'size': size,
+        'generate_s': round(generate.wall_s, 3),
+        'phases': phases,
+        'wall_s': round(sum(p['wall_s'] for p in phases.values()), 6),
+        'max_rss_kb': phases['history_delete']['max_rss_kb'],
+    }
+
+
+def run_size(size):
+    """在子进程中运行一个规模，避免峰值内存互相影响"""
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.bench_library', '--worker', str(size)],
+        text=True,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='播放器视频库与历史记录基准测试')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 50000, 100000])
+    parser.add_argument('--output', default='bench_output/bench_library.json')
+    parser.add_argument('--compare', help='与之前的 JSON 结果对比')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        work_dir = tempfile.mkdtemp(prefix='bench_library_')
+        try:
+            result = run_worker(args.worker, work_dir)
+        finally:
+            os.chdir(tempfile.gettempdir())
+            shutil.rmtree(work_dir, ignore_errors=True)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for size in args.sizes:
+        result = run_size(size)
+        results.append(result)
+        timings = '  '.join(f"{name}={p['wall_s']:.3f}s" for name, p in result['phases'].items())
+        print(f"size={size:<7d} {timings}  rss={result['max_rss_kb']} KB")
+
+    report = write_report(args.output, 'library', results)
+    print(f'结果已写入 {args.output}')
+    if args.compare:
+        compare_reports(args.compare, report, ('size',))
+
+
+if __name__ == '__main__':
+    main()
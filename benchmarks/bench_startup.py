@@ -0,0 +1,87 @@
+"""启动耗时基准测试
+
+以 --startup-timing 参数多次启动下载器和播放器（offscreen Qt 平台），
+统计导入完成、窗口显示、首次绘制以及后台加载完成的时间点，取中位数。
+
+用法::
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --compare old_bench_startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import compare_reports, write_report
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = {
+    'downloader': 'youtube_downloader.py',
+    'player': 'video_player.py',
+}
+
+
+def run_once(script, work_dir):
+    """启动一次应用，返回进程内时间点和外部测得的总耗时"""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    start = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, os.path.join(ROOT_DIR, script), '--startup-timing'],
+        cwd=work_dir, env=env, text=True, timeout=120,
+    )
+    total = time.perf_counter() - start
+    report = json.loads(output.strip().splitlines()[-1])
+    report['marks']['process_total'] = round(total, 6)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时基准测试')
+    parser.add_argument('--apps', nargs='+', choices=list(APPS), default=list(APPS))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='bench_output/bench_startup.json')
+    parser.add_argument('--compare', help='与之前的 JSON 结果对比')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_startup_')
+    results = []
+    try:
+        for app in args.apps:
+            runs = [run_once(APPS[app], work_dir) for _ in range(args.runs)]
+            names = sorted(set().union(*(r['marks'] for r in runs)))
+            marks = {
+                name: round(statistics.median(r['marks'][name] for r in runs if name in r['marks']), 6)
+                for name in names
+            }
+            missing = sorted(set().union(*(r['missing'] for r in runs)))
+            result = {
+                'app': app,
+                'runs': args.runs,
+                'marks': marks,
+                'missing': missing,
+                # 用户可以开始操作的时间点
+                'wall_s': marks.get('first_paint'),
+            }
+            results.append(result)
+            timings = '  '.join(f'{name}={value:.3f}s' for name, value in marks.items())
+            print(f'{app:10s} {timings}')
+            if missing:
+                print(f'  未记录到: {", ".join(missing)}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = write_report(args.output, 'startup', results)
+    print(f'结果已写入 {args.output}')
+    if args.compare:
+        compare_reports(args.compare, report, ('app',))
+
+
+if __name__ == '__main__':
+    main()
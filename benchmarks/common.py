@@ -0,0 +1,122 @@
+"""基准测试公共工具：计时、CPU/内存统计、结果读写与对比"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+
+def max_rss_kb():
+    """进程峰值常驻内存（KB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 返回字节，Linux 返回 KB
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class Measure:
+    """统计一段代码的墙钟时间、CPU 时间和 Python 内存峰值
+
+    用法::
+
+        with Measure() as m:
+            ...
+        m.as_dict()
+    """
+
+    def __enter__(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_s = time.perf_counter() - self.wall_start
+        self.cpu_s = time.process_time() - self.cpu_start
+        _, self.peak_alloc_bytes = tracemalloc.get_traced_memory()
+        if self.started_tracing:
+            tracemalloc.stop()
+        self.max_rss_kb = max_rss_kb()
+        return False
+
+    def as_dict(self):
+        return {
+            'wall_s': round(self.wall_s, 6),
+            'cpu_s': round(self.cpu_s, 6),
+            'peak_alloc_bytes': self.peak_alloc_bytes,
+            'max_rss_kb': self.max_rss_kb,
+        }
+
+
+def summarize(values):
+    """对一组耗时求平均值/最大值/总和"""
+    if not values:
+        return {'count': 0, 'mean': None, 'max': None, 'total': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 6),
+        'max': round(max(values), 6),
+        'total': round(sum(values), 6),
+    }
+
+
+def git_revision():
+    """当前代码版本，用于区分不同版本的测试结果"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+
+def write_report(path, name, results, extra=None):
+    """将测试结果写入 JSON 文件"""
+    report = {
+        'benchmark': name,
+        'revision': git_revision(),
+        'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if extra:
+        report.update(extra)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def compare_reports(baseline_path, report, key_fields, metric='wall_s'):
+    """与基线结果对比，打印每个场景的耗时变化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def key(result):
+        return tuple(result.get(k) for k in key_fields)
+
+    old_results = {key(r): r for r in baseline.get('results', [])}
+    print(f"\n与基线 {baseline.get('revision', '?')} 对比 ({metric}):")
+    for result in report['results']:
+        old = old_results.get(key(result))
+        label = ' '.join(f"{k}={v}" for k, v in zip(key_fields, key(result)))
+        if not old or not old.get(metric):
+            print(f"  {label}: 基线中无此场景")
+            continue
+        change = (result[metric] - old[metric]) / old[metric] * 100
+        print(f"  {label}: {old[metric]:.4f} -> {result[metric]:.4f} ({change:+.1f}%)")
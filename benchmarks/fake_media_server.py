@@ -0,0 +1,248 @@
+"""本地假媒体服务器
+
+在本机启动一个 HTTP 服务器，提供合成的渐进式(progressive)、HLS 和 DASH 媒体，
+用于在无网络的情况下测试下载流程。系统中有 ffmpeg 时生成真实可解码的媒体，
+否则退化为随机字节（此时不提供需要合并的 DASH 场景）。
+
+路由：
+    /progressive/<任意名称>.mp4   单文件 mp4
+    /hls/<任意名称>.m3u8         HLS 播放列表，分片位于 /hls/seg_XXX.ts
+    /dash/<任意名称>.mpd         DASH 清单，视频/音频分离，下载后需要合并
+
+单独运行::
+
+    python -m benchmarks.fake_media_server --port 8765
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4a': 'audio/mp4',
+    '.ts': 'video/mp2t',
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mpd': 'application/dash+xml',
+}
+
+MPD_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" minBufferTime="PT2S"
+     mediaPresentationDuration="PT{duration}S" profiles="urn:mpeg:dash:profile:isoff-on-demand:2011">
+  <Period>
+    <AdaptationSet mimeType="video/mp4" contentType="video">
+      <Representation id="video" bandwidth="{video_bandwidth}" width="1280" height="720" codecs="mp4v.20.9">
+        <BaseURL>video.mp4</BaseURL>
+      </Representation>
+    </AdaptationSet>
+    <AdaptationSet mimeType="audio/mp4" contentType="audio" lang="en">
+      <Representation id="audio" bandwidth="128000" codecs="mp4a.40.2" audioSamplingRate="44100">
+        <BaseURL>audio.m4a</BaseURL>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+'''
+
+
+def has_ffmpeg():
+    return shutil.which('ffmpeg') is not None
+
+
+def run_ffmpeg(args):
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error'] + args, check=True)
+
+
+def generate_media(media_dir, duration=10, random_size=8 * 1024 * 1024):
+    """生成测试媒体，返回可用的场景列表"""
+    os.makedirs(os.path.join(media_dir, 'hls'), exist_ok=True)
+    os.makedirs(os.path.join(media_dir, 'dash'), exist_ok=True)
+
+    if not has_ffmpeg():
+        # 没有 ffmpeg 时使用随机字节：渐进式下载与 HLS 分片拼接不需要可解码的媒体
+        with open(os.path.join(media_dir, 'progressive.mp4'), 'wb') as f:
+            f.write(os.urandom(random_size))
+        segments = 5
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2',
+                 '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(segments):
+            name = f'seg_{i:03d}.ts'
+            with open(os.path.join(media_dir, 'hls', name), 'wb') as f:
+                f.write(os.urandom(random_size // segments))
+            lines += ['#EXTINF:2.0,', name]
+        lines.append('#EXT-X-ENDLIST')
+        with open(os.path.join(media_dir, 'hls', 'playlist.m3u8'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return ['progressive', 'hls']
+
+    video_src = ['-f', 'lavfi', '-i', f'testsrc=size=1280x720:rate=30:duration={duration}']
+    audio_src = ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}']
+    video_codec = ['-c:v', 'mpeg4', '-q:v', '5']
+    audio_codec = ['-c:a', 'aac', '-b:a', '128k']
+
+    run_ffmpeg(video_src + audio_src + video_codec + audio_codec +
+               [os.path.join(media_dir, 'progressive.mp4')])
+    run_ffmpeg(video_src + audio_src + video_codec + audio_codec +
+               ['-f', 'hls', '-hls_time', '2', '-hls_list_size', '0',
+                '-hls_segment_filename', os.path.join(media_dir, 'hls', 'seg_%03d.ts'),
+                os.path.join(media_dir, 'hls', 'playlist.m3u8')])
+    run_ffmpeg(video_src + video_codec + ['-an', os.path.join(media_dir, 'dash', 'video.mp4')])
+    run_ffmpeg(audio_src + audio_codec + ['-vn', os.path.join(media_dir, 'dash', 'audio.m4a')])
+
+    video_size = os.path.getsize(os.path.join(media_dir, 'dash', 'video.mp4'))
+    mpd = MPD_TEMPLATE.format(
+        duration=duration,
+        video_bandwidth=max(1, video_size * 8 // duration),
+    )
+    with open(os.path.join(media_dir, 'dash', 'manifest.mpd'), 'w') as f:
+        f.write(mpd)
+    return ['progressive', 'hls', 'dash']
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """支持 Range 请求的静态媒体处理器"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def resolve(self):
+        """把请求路径映射到媒体文件"""
+        path = self.path.split('?', 1)[0]
+        media_dir = self.server.media_dir
+        if path.startswith('/progressive/') and path.endswith('.mp4'):
+            return os.path.join(media_dir, 'progressive.mp4')
+        if path.startswith('/hls/'):
+            name = path[len('/hls/'):]
+            if name.endswith('.m3u8'):
+                return os.path.join(media_dir, 'hls', 'playlist.m3u8')
+            if re.fullmatch(r'seg_\d+\.ts', name):
+                return os.path.join(media_dir, 'hls', name)
+        if path.startswith('/dash/'):
+            name = path[len('/dash/'):]
+            if name.endswith('.mpd'):
+                return os.path.join(media_dir, 'dash', 'manifest.mpd')
+            if name in ('video.mp4', 'audio.m4a'):
+                return os.path.join(media_dir, 'dash', name)
+        return None
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        file_path = self.resolve()
+        if not file_path or not os.path.exists(file_path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(file_path)
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get('Range')
+        match = re.match(r'bytes=(\d*)-(\d*)', range_header or '')
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        length = end - start + 1
+        ext = os.path.splitext(file_path)[1]
+        self.send_response(status)
+        self.send_header('Content-Type', CONTENT_TYPES.get(ext, 'application/octet-stream'))
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if not send_body:
+            return
+
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                self.server.add_bytes(len(chunk))
+
+
+class FakeMediaServer(ThreadingHTTPServer):
+    """在后台线程中运行的假媒体服务器，统计发送的字节数"""
+    daemon_threads = True
+
+    def __init__(self, media_dir=None, port=0, duration=10):
+        super().__init__(('127.0.0.1', port), MediaRequestHandler)
+        self.owns_media_dir = media_dir is None
+        self.media_dir = media_dir or tempfile.mkdtemp(prefix='fake_media_')
+        self.scenarios = generate_media(self.media_dir, duration)
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def url_for(self, scenario, name):
+        ext = {'progressive': 'mp4', 'hls': 'm3u8', 'dash': 'mpd'}[scenario]
+        return f'{self.base_url}/{scenario}/{name}.{ext}'
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes_sent += count
+
+    def reset_bytes(self):
+        with self.lock:
+            sent, self.bytes_sent = self.bytes_sent, 0
+        return sent
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+        if self.owns_media_dir:
+            shutil.rmtree(self.media_dir, ignore_errors=True)
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地假媒体服务器')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--duration', type=int, default=10, help='合成媒体时长（秒）')
+    args = parser.parse_args()
+
+    with FakeMediaServer(port=args.port, duration=args.duration) as server:
+        for scenario in server.scenarios:
+            print(f'{scenario}: {server.url_for(scenario, "sample")}')
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,538 @@
+"""局域网内容缓存
+
+多台机器下载同一个视频时，只有第一台从 YouTube 下载，其余机器通过局域网从缓存获取。
+缓存服务是一个简单的 HTTP 服务器，按“视频ID / 格式”保存媒体文件和它的 .vinfo 信息：
+
+    GET /objects/<视频ID>/<格式>          查询，存在时返回 .vinfo 信息（JSON），否则 404
+    GET /objects/<视频ID>/<格式>/file     下载媒体文件，支持 Range 请求（断点续传）
+    PUT /objects/<视频ID>/<格式>/file     上传媒体文件，返回上传编号
+    PUT /objects/<视频ID>/<格式>          提交 .vinfo 信息和上传编号，校验和一致后才对外可见
+
+视频ID形如 youtube-dQw4w9WgXcQ，格式形如 video-1080p、audio。
+下载前根据链接直接算出视频ID查询缓存，命中时不再请求 YouTube；
+下载完成的文件在后台上传到缓存。获取的文件按 .vinfo 中的校验和验证。
+
+缓存服务没有身份验证，只应在可信的局域网中运行::
+
+    python content_cache.py --dir cache --port 8765 --max-gb 500
+
+下载器在 data/config.json 中设置 {"content_cache": {"url": "http://192.168.1.10:8765"}} 后启用。
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, quote, urlparse
+from urllib.request import Request, urlopen
+from metrics import registry
+from file_integrity import CHUNK_SIZE, new_hash, make_checksum
+from ydl_pool import load_yt_dlp
+
+# 视频ID和格式只允许这些字符，并且必须以字母或数字开头，"." 和 ".." 不能作为键；
+# ContentCacheStore.object_dir 另外检查最终路径仍在缓存目录内
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$')
+
+OBJECT_PATH_PATTERN = re.compile(r'^/objects/([^/]+)/([^/]+)(/file)?$')
+
+MEDIA_FILE = 'media'
+META_FILE = 'meta.json'
+
+# 未提交的上传超过这个时间（秒）后删除
+STALE_UPLOAD_SECONDS = 24 * 3600
+
+
+class ContentCacheError(Exception):
+    """内容缓存不可用或数据无效"""
+
+
+def format_key_for(mode, resolution):
+    return f'video-{resolution}' if mode == 'video' else mode
+
+
+def video_key_for(extractor_key, video_id):
+    return f'{extractor_key.lower()}-{video_id}'
+
+
+def video_key_for_url(url):
+    """不访问网络，根据链接算出视频ID，无法识别时返回 None"""
+    yt_dlp = load_yt_dlp()
+    if parse_qs(urlparse(url).query).get('v'):
+        # watch?v=ID&list=PL... 会被播放列表提取器认领，但下载的是其中的单个视频（noplaylist），
+        # 必须与上传时使用的 youtube-ID 一致
+        video_id = yt_dlp.extractor.get_info_extractor('Youtube').get_temp_id(url)
+        if video_id:
+            key = video_key_for('Youtube', video_id)
+            return key if KEY_PATTERN.match(key) else None
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.ie_key() == 'Generic' or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        if not video_id:
+            return None
+        key = video_key_for(ie.ie_key(), video_id)
+        return key if KEY_PATTERN.match(key) else None
+    return None
+
+
+# ---- 客户端 ----
+
+class ContentCacheClient:
+    """内容缓存客户端，上传在后台线程中依次进行"""
+
+    def __init__(self, base_url, timeout=10, max_attempts=5):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.publish_queue = queue.Queue()
+        self.publisher = None
+        self.lock = threading.Lock()
+
+    def object_url(self, video_key, format_key, file=False):
+        url = f'{self.base_url}/objects/{quote(video_key)}/{quote(format_key)}'
+        return url + '/file' if file else url
+
+    def lookup(self, video_key, format_key):
+        """查询缓存，返回 .vinfo 信息，缓存中没有时返回 None"""
+        try:
+            with urlopen(self.object_url(video_key, format_key), timeout=self.timeout) as response:
+                return json.load(response)
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise ContentCacheError(f'查询内容缓存失败: {e}')
+        except (OSError, HTTPException, ValueError) as e:
+            raise ContentCacheError(f'查询内容缓存失败: {e}')
+
+    def fetch(self, video_key, format_key, meta, dest_path, on_progress=None):
+        """从缓存下载文件到 dest_path，返回校验和记录
+
+        数据先写入 dest_path.part，连接中断时用 Range 请求从已有位置继续；
+        重试时（包括下载线程的重试）已下载的部分会被保留。
+        on_progress(已下载字节数, 总字节数) 可以抛出异常以中止下载。
+        """
+        checksum = meta['checksum']
+        total = checksum['size']
+        part_path = dest_path + '.part'
+        hash_obj = new_hash(checksum['algorithm'])
+        offset = 0
+        if os.path.exists(part_path):
+            # 续传：已有部分先计入校验和
+            with open(part_path, 'rb') as f:
+                while offset < total:
+                    chunk = f.read(min(CHUNK_SIZE, total - offset))
+                    if not chunk:
+                        break
+                    hash_obj.update(chunk)
+                    offset += len(chunk)
+            with open(part_path, 'r+b') as f:
+                f.truncate(offset)
+
+        attempt = 0
+        while offset < total:
+            request = Request(self.object_url(video_key, format_key, file=True),
+                              headers={'Range': f'bytes={offset}-'})
+            try:
+                with urlopen(request, timeout=self.timeout) as response, open(part_path, 'ab') as f:
+                    if response.status != 206 and offset:
+                        # 服务器没有按 Range 返回，只能从头开始
+                        f.truncate(0)
+                        hash_obj = new_hash(checksum['algorithm'])
+                        offset = 0
+                    while True:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        hash_obj.update(chunk)
+                        offset += len(chunk)
+                        registry.inc('cache_bytes_fetched_total', len(chunk))
+                        if on_progress:
+                            on_progress(offset, total)
+            except HTTPError as e:
+                raise ContentCacheError(f'从内容缓存下载失败: {e}')
+            except (OSError, HTTPException) as e:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    raise ContentCacheError(f'从内容缓存下载失败: {e}')
+                registry.inc('cache_fetch_retries_total')
+                time.sleep(min(2 ** attempt, 30))
+
+        if offset != total or hash_obj.hexdigest() != checksum['value']:
+            os.remove(part_path)
+            raise ContentCacheError('内容缓存中的文件校验失败')
+        os.replace(part_path, dest_path)
+        return make_checksum(hash_obj, total)
+
+    def publish(self, video_key, format_key, file_path, video_info):
+        """上传文件和 .vinfo 信息，缓存中已有时跳过"""
+        if self.lookup(video_key, format_key) is not None:
+            return False
+        size = os.path.getsize(file_path)
+        try:
+            with open(file_path, 'rb') as f:
+                request = Request(
+                    self.object_url(video_key, format_key, file=True), data=f, method='PUT',
+                    headers={'Content-Length': str(size), 'Content-Type': 'application/octet-stream'},
+                )
+                with urlopen(request, timeout=self.timeout) as response:
+                    upload = json.load(response)['upload']
+
+            meta = dict(video_info)
+            meta['ext'] = file_path.rsplit('.', 1)[-1]
+            meta['upload'] = upload
+            request = Request(
+                self.object_url(video_key, format_key),
+                data=json.dumps(meta, ensure_ascii=False).encode('utf-8'), method='PUT',
+                headers={'Content-Type': 'application/json; charset=utf-8'},
+            )
+            with urlopen(request, timeout=self.timeout):
+                pass
+        except (OSError, HTTPException, ValueError, KeyError) as e:
+            raise ContentCacheError(f'上传到内容缓存失败: {e}')
+        registry.inc('cache_published_total')
+        registry.inc('cache_bytes_published_total', size)
+        return True
+
+    def publish_async(self, video_key, format_key, file_path, video_info):
+        """在后台上传，不阻塞下载线程"""
+        with self.lock:
+            if self.publisher is None:
+                self.publisher = threading.Thread(target=self.publish_loop, name='cache-publisher',
+                                                  daemon=True)
+                self.publisher.start()
+        self.publish_queue.put((video_key, format_key, file_path, video_info))
+
+    def publish_loop(self):
+        while True:
+            video_key, format_key, file_path, video_info = self.publish_queue.get()
+            try:
+                with registry.span('cache.publish'):
+                    self.publish(video_key, format_key, file_path, video_info)
+            except Exception as e:
+                print(f"上传到内容缓存失败: {e}")
+
+
+def client_from_config(config):
+    """根据配置创建内容缓存客户端，没有配置地址时返回 None"""
+    settings = config['content_cache']
+    if not settings['url']:
+        return None
+    return ContentCacheClient(settings['url'], settings['timeout'])
+
+
+# ---- 服务器 ----
+
+class ContentCacheStore:
+    """缓存目录，每个对象是 <目录>/<视频ID>/<格式>/ 下的 media 和 meta.json"""
+
+    def __init__(self, cache_dir, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.real_cache_dir = os.path.realpath(cache_dir)
+
+    def object_dir(self, video_key, format_key):
+        """返回对象目录，键无效或路径不在缓存目录内时抛出 ContentCacheError"""
+        if not (KEY_PATTERN.match(video_key) and KEY_PATTERN.match(format_key)):
+            raise ContentCacheError('无效的缓存键')
+        object_dir = os.path.join(self.cache_dir, video_key, format_key)
+        real_dir = os.path.realpath(object_dir)
+        if os.path.commonpath([real_dir, self.real_cache_dir]) != self.real_cache_dir:
+            raise ContentCacheError('无效的缓存键')
+        return object_dir
+
+    def read_meta(self, video_key, format_key):
+        meta_path = os.path.join(self.object_dir(video_key, format_key), META_FILE)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # meta.json 的修改时间记录最近一次访问，用于淘汰
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return meta
+
+    def media_path(self, video_key, format_key):
+        return os.path.join(self.object_dir(video_key, format_key), MEDIA_FILE)
+
+    def receive_upload(self, video_key, format_key, stream, length):
+        """接收上传的文件，边写边计算校验和，返回上传编号"""
+        object_dir = self.object_dir(video_key, format_key)
+        os.makedirs(object_dir, exist_ok=True)
+        upload = uuid.uuid4().hex
+        part_path = os.path.join(object_dir, f'{upload}.part')
+        hash_obj = new_hash()
+        remaining = length
+        try:
+            with open(part_path, 'wb') as f:
+                while remaining:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ContentCacheError('上传数据不完整')
+                    f.write(chunk)
+                    hash_obj.update(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            os.remove(part_path)
+            raise
+        with open(part_path + '.sum', 'w', encoding='utf-8') as f:
+            json.dump(make_checksum(hash_obj, length), f)
+        return upload
+
+    def commit(self, video_key, format_key, meta):
+        """上传的文件与 meta 中的校验和一致时替换为正式对象"""
+        object_dir = self.object_dir(video_key, format_key)
+        upload = meta.pop('upload', '')
+        if not isinstance(upload, str) or not KEY_PATTERN.match(upload):
+            raise ContentCacheError('无效的上传编号')
+        part_path = os.path.join(object_dir, f'{upload}.part')
+        try:
+            with open(part_path + '.sum', 'r', encoding='utf-8') as f:
+                received = json.load(f)
+        except (OSError, ValueError):
+            raise ContentCacheError('上传不存在')
+        try:
+            expected = meta.get('checksum') or {}
+            if (expected.get('algorithm') != received['algorithm']
+                    or expected.get('value') != received['value']
+                    or expected.get('size') != received['size']):
+                os.remove(part_path)
+                raise ContentCacheError('上传的文件与校验和不一致')
+            with self.lock:
+                os.replace(part_path, os.path.join(object_dir, MEDIA_FILE))
+                tmp_path = os.path.join(object_dir, META_FILE + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, os.path.join(object_dir, META_FILE))
+        finally:
+            os.remove(part_path + '.sum')
+        registry.inc('cache_objects_stored_total')
+        if self.max_bytes:
+            self.evict()
+
+    def list_objects(self):
+        """返回 [(最近访问时间, 大小, 对象目录)]"""
+        objects = []
+        for video_entry in os.scandir(self.cache_dir):
+            if not video_entry.is_dir():
+                continue
+            for format_entry in os.scandir(video_entry.path):
+                try:
+                    meta_stat = os.stat(os.path.join(format_entry.path, META_FILE))
+                    size = os.path.getsize(os.path.join(format_entry.path, MEDIA_FILE))
+                except OSError:
+                    continue
+                objects.append((meta_stat.st_mtime, size, format_entry.path))
+        return objects
+
+    def evict(self):
+        """超过容量上限时删除最久没有访问的对象"""
+        with self.lock:
+            objects = sorted(self.list_objects())
+            total = sum(size for _, size, _ in objects)
+            for _, size, object_dir in objects:
+                if total <= self.max_bytes:
+                    break
+                # 先删除 meta.json，正在进行的查询不会再看到这个对象
+                os.remove(os.path.join(object_dir, META_FILE))
+                shutil.rmtree(object_dir, ignore_errors=True)
+                try:
+                    # 视频的所有格式都被删除后删除视频目录
+                    os.rmdir(os.path.dirname(object_dir))
+                except OSError:
+                    pass
+                total -= size
+                registry.inc('cache_objects_evicted_total')
+
+    def remove_stale_uploads(self):
+        now = time.time()
+        for video_entry in os.scandir(self.cache_dir):
+            if not video_entry.is_dir():
+                continue
+            for format_entry in os.scandir(video_entry.path):
+                for entry in os.scandir(format_entry.path):
+                    if '.part' in entry.name and now - entry.stat().st_mtime > STALE_UPLOAD_SECONDS:
+                        os.remove(entry.path)
+
+
+def parse_range(header, size):
+    """解析 Range 请求头，返回 (起始, 结束)；无法满足时返回 None"""
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # bytes=-N 表示最后 N 个字节
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+class ContentCacheRequestHandler(BaseHTTPRequestHandler):
+    """内容缓存的 HTTP 接口"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def parse_object_path(self):
+        """返回 (视频ID, 格式, 是否为文件)，路径无效时返回 None"""
+        match = OBJECT_PATH_PATTERN.match(self.path.split('?', 1)[0])
+        if not match:
+            return None
+        try:
+            self.server.store.object_dir(match.group(1), match.group(2))
+        except ContentCacheError:
+            return None
+        return match.group(1), match.group(2), bool(match.group(3))
+
+    def do_GET(self):
+        parsed = self.parse_object_path()
+        if parsed is None:
+            self.send_json(404, {'error': '不存在'})
+            return
+        video_key, format_key, is_file = parsed
+        store = self.server.store
+        meta = store.read_meta(video_key, format_key)
+        if meta is None:
+            registry.inc('cache_lookup_misses_total')
+            self.send_json(404, {'error': '不存在'})
+            return
+        if not is_file:
+            registry.inc('cache_lookup_hits_total')
+            self.send_json(200, meta)
+            return
+        self.send_media(store.media_path(video_key, format_key))
+
+    def send_media(self, media_path):
+        try:
+            f = open(media_path, 'rb')
+        except OSError:
+            self.send_json(404, {'error': '不存在'})
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            range_header = self.headers.get('Range')
+            if range_header:
+                byte_range = parse_range(range_header, size)
+                if byte_range is None:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            f.seek(start)
+            remaining = end - start + 1
+            try:
+                while remaining:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            except OSError:
+                # 客户端断开，之后会用 Range 续传
+                self.close_connection = True
+            registry.inc('cache_bytes_served_total', end - start + 1 - remaining)
+
+    def do_PUT(self):
+        parsed = self.parse_object_path()
+        if parsed is None:
+            self.send_json(404, {'error': '不存在'})
+            self.close_connection = True
+            return
+        video_key, format_key, is_file = parsed
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.send_json(411, {'error': '需要 Content-Length'})
+            self.close_connection = True
+            return
+        store = self.server.store
+        try:
+            if is_file:
+                upload = store.receive_upload(video_key, format_key, self.rfile, int(length))
+                self.send_json(200, {'upload': upload})
+            else:
+                meta = json.loads(self.rfile.read(int(length)))
+                if not isinstance(meta, dict):
+                    raise ContentCacheError('meta 必须是 JSON 对象')
+                store.commit(video_key, format_key, meta)
+                self.send_json(200, {'stored': True})
+        except (ContentCacheError, ValueError) as e:
+            self.send_json(400, {'error': str(e)})
+            self.close_connection = True
+        except OSError as e:
+            self.send_json(500, {'error': str(e)})
+            self.close_connection = True
+
+
+def make_server(cache_dir, host='0.0.0.0', port=8765, max_bytes=0):
+    server = ThreadingHTTPServer((host, port), ContentCacheRequestHandler)
+    server.daemon_threads = True
+    server.store = ContentCacheStore(cache_dir, max_bytes)
+    server.store.remove_stale_uploads()
+    return server
+
+
+def start_server(cache_dir, host='127.0.0.1', port=8765, max_bytes=0):
+    """在后台线程中启动缓存服务（用于本机测试），返回服务器对象"""
+    server = make_server(cache_dir, host, port, max_bytes)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='局域网内容缓存服务')
+    parser.add_argument('--dir', default='cache', help='缓存目录')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--max-gb', type=float, default=0, help='缓存容量上限（GB），0 表示不限制')
+    args = parser.parse_args()
+
+    server = make_server(args.dir, args.host, args.port, int(args.max_gb * 1024 ** 3))
+    print(f'内容缓存服务已启动: http://{args.host}:{args.port}，缓存目录 {os.path.abspath(args.dir)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
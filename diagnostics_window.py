@@ -0,0 +1,84 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
+                           QTreeWidget, QTreeWidgetItem, QHeaderView, QLabel)
+from PyQt6.QtCore import QTimer
+from metrics import registry
+
+class DiagnosticsWindow(QDialog):
+    """诊断面板：实时显示计时区间、计数器和仪表"""
+    def __init__(self, metrics_file=None):
+        super().__init__()
+        self.metrics_file = metrics_file
+        self.setup_ui()
+        self.refresh()
+
+        # 每秒刷新一次
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+
+    def setup_ui(self):
+        """设置UI界面"""
+        self.setWindowTitle("诊断信息")
+        self.setMinimumSize(650, 450)
+
+        layout = QVBoxLayout(self)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        self.metrics_tree = QTreeWidget()
+        self.metrics_tree.setHeaderLabels(["指标", "次数/值", "平均(秒)", "最大(秒)", "最近(秒)"])
+        header = self.metrics_tree.header()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column in range(1, 5):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.metrics_tree)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+
+        self.export_button = QPushButton("导出指标文件")
+        self.export_button.clicked.connect(self.export_metrics)
+        self.export_button.setEnabled(bool(self.metrics_file))
+        buttons_layout.addWidget(self.export_button)
+
+        close_button = QPushButton("关闭")
+        close_button.clicked.connect(self.close)
+        buttons_layout.addWidget(close_button)
+
+        layout.addLayout(buttons_layout)
+
+    def refresh(self):
+        """刷新指标显示"""
+        snapshot = registry.snapshot()
+        self.summary_label.setText(f"运行时间: {snapshot['uptime_s']:.0f} 秒")
+
+        self.metrics_tree.clear()
+        spans = QTreeWidgetItem(["计时区间"])
+        for name, stats in sorted(snapshot['spans'].items()):
+            spans.addChild(QTreeWidgetItem([
+                name, str(stats['count']), f"{stats['mean_s']:.3f}",
+                f"{stats['max_s']:.3f}", f"{stats['last_s']:.3f}"
+            ]))
+        counters = QTreeWidgetItem(["计数器"])
+        for name, value in sorted(snapshot['counters'].items()):
+            counters.addChild(QTreeWidgetItem([name, str(value)]))
+        gauges = QTreeWidgetItem(["仪表"])
+        for name, value in sorted(snapshot['gauges'].items()):
+            gauges.addChild(QTreeWidgetItem([name, str(value)]))
+
+        self.metrics_tree.addTopLevelItems([spans, counters, gauges])
+        self.metrics_tree.expandAll()
+
+    def export_metrics(self):
+        """导出指标到文件"""
+        try:
+            registry.export_to_file(self.metrics_file)
+            self.summary_label.setText(f"已导出到 {self.metrics_file}")
+        except Exception as e:
+            self.summary_label.setText(f"导出失败: {str(e)}")
+
+    def closeEvent(self, event):
+        """窗口关闭事件"""
+        self.timer.stop()
+        event.accept()
@@ -0,0 +1,148 @@
+"""磁盘空间预留与文件移动
+
+下载开始前根据格式的 filesize/filesize_approx 估算所需空间并在目标磁盘上预留，
+空间不足时直接拒绝，避免传输完成后才在合并阶段发现磁盘已满。
+预留记录在进程内，同一进程（例如下载服务）中的并发任务会互相扣除已预留的空间。
+"""
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from metrics import registry
+
+
+# yt-dlp 下载过程中的中间文件：未完成的 .part/.ytdl 和分片、合并前的单独格式流（标题.f137.mp4）、
+# 合并时的临时文件（标题.temp.mp4）
+PARTIAL_FILE_PATTERN = re.compile(r'(\.part|\.ytdl|\.part-Frag\d+|\.f\d+\.\w+|\.temp\.\w+)$')
+
+
+def is_partial_file(name):
+    return bool(PARTIAL_FILE_PATTERN.search(name))
+
+
+def remove_partial_files(directory):
+    """删除目录中的中间文件，目录空了就删除目录，返回保留下来的文件名列表"""
+    kept = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return kept
+    for name in names:
+        path = os.path.join(directory, name)
+        if is_partial_file(name) and os.path.isfile(path):
+            try:
+                os.remove(path)
+                continue
+            except OSError:
+                pass
+        kept.append(name)
+    if not kept:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+    return kept
+
+
+class InsufficientDiskSpace(Exception):
+    """磁盘空间不足"""
+
+
+def estimate_download_size(info):
+    """估算下载所需字节数，无法估算时返回 None"""
+    formats = info.get('requested_formats') or [info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            # 没有大小信息（如 HLS）时用码率估算
+            size = fmt['tbr'] * 1000 / 8 * info['duration']
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+def device_of(path):
+    return os.stat(path).st_dev
+
+
+class DiskSpaceReservations:
+    """按磁盘记录已预留的空间"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserved = {}
+
+    @contextmanager
+    def reserve(self, requirements, margin=0):
+        """预留空间，requirements 为 {目录: 字节数}，同一磁盘上的需求会合并
+
+        可用空间不足时抛出 InsufficientDiskSpace。
+        """
+        by_device = {}
+        for path, nbytes in requirements.items():
+            device = device_of(path)
+            needed, _ = by_device.get(device, (0, path))
+            by_device[device] = (needed + nbytes, path)
+
+        with self.lock:
+            for device, (needed, path) in by_device.items():
+                free = shutil.disk_usage(path).free - self.reserved.get(device, 0)
+                if free - margin < needed:
+                    registry.inc('download_rejected_disk_space_total')
+                    raise InsufficientDiskSpace(
+                        f'磁盘空间不足: {path} 需要 {needed / 1024 ** 2:.0f} MB，'
+                        f'可用 {max(free, 0) / 1024 ** 2:.0f} MB（另需保留 {margin / 1024 ** 2:.0f} MB）'
+                    )
+            for device, (needed, _) in by_device.items():
+                self.reserved[device] = self.reserved.get(device, 0) + needed
+        try:
+            yield
+        finally:
+            with self.lock:
+                for device, (needed, _) in by_device.items():
+                    self.reserved[device] -= needed
+                    if not self.reserved[device]:
+                        del self.reserved[device]
+
+
+disk_reservations = DiskSpaceReservations()
+
+
+def copy_file(src, dst, hash_obj=None):
+    """复制文件，给出 hash_obj 时在复制过程中顺便计算校验和"""
+    if hash_obj is None:
+        shutil.copyfile(src, dst)
+        return
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            chunk = fsrc.read(1024 * 1024)
+            if not chunk:
+                break
+            hash_obj.update(chunk)
+            fdst.write(chunk)
+
+
+def move_into_dir(src, dst_dir, hash_obj=None):
+    """把文件移动到目标目录，目标位置不会出现写了一半的文件
+
+    同一磁盘上直接 os.replace；跨磁盘时先复制为临时文件，再原子重命名，
+    给出 hash_obj 时复制的同时计算校验和。
+    """
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if device_of(os.path.dirname(src) or '.') == device_of(dst_dir):
+        os.replace(src, dst)
+        return dst
+
+    tmp_dst = dst + '.moving'
+    try:
+        copy_file(src, tmp_dst, hash_obj)
+        os.replace(tmp_dst, dst)
+    except BaseException:
+        if os.path.exists(tmp_dst):
+            os.remove(tmp_dst)
+        raise
+    os.remove(src)
+    return dst
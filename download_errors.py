@@ -0,0 +1,81 @@
+"""下载错误分类与重试策略
+
+根据 yt-dlp 的错误信息把失败分为几类，每类有各自的重试次数和退避时间：
+
+    network       临时网络错误（超时、连接重置、HTTP 5xx），多次重试
+    rate_limited  被限流（HTTP 429、需要登录确认不是机器人），长时间退避后重试
+    geo_blocked   地区限制，重试无意义
+    unavailable   视频已删除、私享或不存在，重试无意义
+    disk_full     磁盘空间不足，不重试
+    cancelled     用户取消，不重试
+    unknown       其它错误，重试一次
+"""
+import random
+import re
+from collections import namedtuple
+
+RetryPolicy = namedtuple('RetryPolicy', ['max_retries', 'base_delay', 'max_delay'])
+
+# 错误类型 -> 重试策略（延迟单位：秒）
+RETRY_POLICIES = {
+    'network': RetryPolicy(max_retries=5, base_delay=2, max_delay=60),
+    'rate_limited': RetryPolicy(max_retries=4, base_delay=30, max_delay=600),
+    'geo_blocked': RetryPolicy(max_retries=0, base_delay=0, max_delay=0),
+    'unavailable': RetryPolicy(max_retries=0, base_delay=0, max_delay=0),
+    'disk_full': RetryPolicy(max_retries=0, base_delay=0, max_delay=0),
+    'cancelled': RetryPolicy(max_retries=0, base_delay=0, max_delay=0),
+    'unknown': RetryPolicy(max_retries=1, base_delay=5, max_delay=5),
+}
+
+# 错误类型在界面中的显示名称
+ERROR_CATEGORY_NAMES = {
+    'network': '网络错误',
+    'rate_limited': '请求受限',
+    'geo_blocked': '地区限制',
+    'unavailable': '视频不可用',
+    'disk_full': '磁盘空间不足',
+    'cancelled': '已取消',
+    'unknown': '未知错误',
+}
+
+# 按顺序匹配，先匹配到的类型生效
+ERROR_PATTERNS = [
+    ('cancelled', re.compile(r'下载已取消')),
+    ('disk_full', re.compile(r'磁盘空间不足|No space left on device|Errno 28|disk is full', re.I)),
+    ('rate_limited', re.compile(
+        r'HTTP Error 429|Too Many Requests|rate.?limit|confirm you.re not a bot', re.I)),
+    ('geo_blocked', re.compile(
+        r'not (?:made this video )?available in your country|geo.?restrict|blocked it in your country', re.I)),
+    ('unavailable', re.compile(
+        r'Video unavailable|has been removed|Private video|This video is private|'
+        r'does not exist|account .* terminated|HTTP Error 404|HTTP Error 410|Unsupported URL|'
+        r'频道或播放列表链接|没有可用的字幕', re.I)),
+    ('network', re.compile(
+        r'HTTP Error 5\d\d|timed? ?out|Connection (?:reset|refused|aborted)|'
+        r'Remote end closed|Temporary failure|Name or service not known|'
+        r'IncompleteRead|getaddrinfo failed|Network is unreachable|'
+        # 只匹配连接中断一类的 SSL 错误，证书校验失败重试也不会成功
+        r'SSL: ?(?:EOF|UNEXPECTED_EOF|WRONG_VERSION)|EOF occurred in violation of protocol|ssl.*timed out', re.I)),
+]
+
+
+def classify_error(error):
+    """返回错误类型名称，error 可以是异常或错误信息字符串"""
+    message = str(error)
+    for category, pattern in ERROR_PATTERNS:
+        if pattern.search(message):
+            return category
+    return 'unknown'
+
+
+def backoff_delay(category, attempt, rng=random):
+    """第 attempt 次重试前的等待时间（秒），使用带抖动的指数退避
+
+    返回 None 表示该类型不再重试。
+    """
+    policy = RETRY_POLICIES[category]
+    if attempt > policy.max_retries:
+        return None
+    ceiling = min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1))
+    # 抖动：在 [ceiling/2, ceiling] 之间随机，避免批量任务同时重试
+    return ceiling / 2 + rng.random() * ceiling / 2
@@ -0,0 +1,476 @@
+"""下载任务
+
+DownloadJob 按顺序下载一批链接：解析信息、预留磁盘空间、下载与合并、计算校验和、
+移出临时目录并写入 .vinfo。这里不依赖 Qt，下载服务在普通线程中直接调用；
+下载器界面通过 youtube_downloader.DownloadThread 在 QThread 中运行并把回调转换为信号。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from metrics import registry
+from download_errors import classify_error, backoff_delay, ERROR_CATEGORY_NAMES
+from ydl_pool import load_yt_dlp, ydl_pool
+from disk_space import (disk_reservations, estimate_download_size, move_into_dir, device_of,
+                        remove_partial_files)
+from file_integrity import GrowingFileHasher, file_state, hash_file, new_hash, make_checksum
+from content_cache import ContentCacheError, video_key_for, video_key_for_url, format_key_for
+
+
+class DownloadCancelled(Exception):
+    """下载被用户取消"""
+
+
+# 下载模式：界面显示名 -> 内部名称
+DOWNLOAD_MODES = {
+    '视频': 'video',
+    '仅音频': 'audio',
+    '仅字幕': 'subtitles',
+}
+
+# 字幕模式下默认下载的语言
+SUBTITLE_LANGS = ['zh.*', 'en.*']
+
+
+class DownloadJob:
+    """下载任务，处理视频下载过程（不依赖 Qt，下载服务直接调用，界面通过 DownloadThread 使用）
+
+    url 可以是单个链接，也可以是链接列表（批量下载），列表中的链接按顺序依次下载，
+    每个完成的链接调用一次 on_finished，全部处理完后调用 on_batch_done。
+    失败时按错误类型自动重试（带抖动的指数退避）：失败的链接放入延后重试队列，先继续下载
+    后面的链接，其余链接处理完后再等待退避时间重试；重试用尽后调用 on_error 和 on_failed。
+    给出 content_cache 时先从局域网内容缓存获取，下载完成的文件再上传到缓存。
+
+    进度和结果通过回调通知（在执行 run() 的线程中调用）：on_progress(消息)、on_finished(结果)、
+    on_error(错误信息)、on_failed(失败记录)、on_batch_done()。
+    """
+
+    def __init__(self, url, download_dir, resolution='1080p', mode='video',
+                 scratch_dir='', reserve_margin=0, content_cache=None,
+                 on_progress=None, on_finished=None, on_error=None, on_failed=None, on_batch_done=None):
+        self.on_progress = on_progress or (lambda message: None)
+        self.on_finished = on_finished or (lambda result: None)
+        self.on_error = on_error or (lambda message: None)
+        self.on_failed = on_failed or (lambda failure: None)
+        self.on_batch_done = on_batch_done or (lambda: None)
+        self.urls = [url] if isinstance(url, str) else list(url)
+        self.url = self.urls[0] if self.urls else ''
+        self.download_dir = download_dir
+        # 设置了临时目录时，下载与合并在临时目录中进行，完成后再移动到下载目录
+        self.scratch_dir = scratch_dir
+        self.work_dir = download_dir
+        self.reserve_margin = reserve_margin
+        self.content_cache = content_cache
+        self.resolution = resolution
+        self.mode = mode
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 每个链接的时间戳，重试时沿用以便续传临时目录中的分片
+        self.url_timestamps = {}
+        self.cancel_event = threading.Event()
+        self.reset_job_stats()
+
+    def reset_job_stats(self):
+        """重置单个链接的计时与字节统计"""
+        self.job_start = time.perf_counter()
+        self.transfer_start = None
+        self.postprocess_start = None
+        self.file_bytes = {}
+        self.file_fragments = {}
+        # 下载过程中增量计算的校验和 {文件路径: GrowingFileHasher}
+        self.hashers = {}
+        # 需要合并的下载不做增量计算：分开的音视频流合并后就被删除，只能对合并后的文件计算
+        self.incremental_checksum = True
+        # 写完的文件的校验和 {文件路径: (校验和, 文件状态)}
+        self.checksums = {}
+
+    def build_ydl_opts(self):
+        """根据下载模式生成 yt-dlp 选项"""
+        ydl_opts = {
+            'outtmpl': os.path.join(
+                self.work_dir,
+                f'%(title)s_{self.timestamp}.%(ext)s'
+            ),
+            'progress_hooks': [self.progress_hook],
+            'postprocessor_hooks': [self.postprocessor_hook],
+            # watch?v=ID&list=... 只下载其中的视频，与内容缓存的视频ID一致
+            'noplaylist': True,
+        }
+
+        if self.mode == 'audio':
+            # 只下载最佳音频，不合并、不获取任何视频数据
+            ydl_opts['format'] = 'bestaudio/best[vcodec=none]'
+        elif self.mode == 'subtitles':
+            # 只下载字幕（含自动生成字幕），跳过媒体文件
+            ydl_opts.update({
+                'skip_download': True,
+                'writesubtitles': True,
+                'writeautomaticsub': True,
+                'subtitleslangs': SUBTITLE_LANGS,
+            })
+        else:
+            ydl_opts['format'] = f'bestvideo[height<={self.resolution[:-1]}]+bestaudio/best'
+            ydl_opts['merge_output_format'] = 'mp4'
+
+        return ydl_opts
+
+    def run(self):
+        total = len(self.urls)
+        # 等待重试的链接 [(可以重试的时间, 链接, 第几次尝试)]
+        deferred = []
+        for index, url in enumerate(self.urls, 1):
+            if total > 1:
+                self.on_progress(f'[{index}/{total}] 开始处理: {url}')
+            if self.is_cancelled():
+                break
+            self.download_attempt(url, 1, deferred)
+        while deferred and not self.is_cancelled():
+            deferred.sort(key=lambda item: item[0])
+            ready_at, url, attempt = deferred.pop(0)
+            if not self.wait_interruptible(ready_at - time.monotonic()):
+                deferred.append((ready_at, url, attempt))
+                break
+            self.download_attempt(url, attempt, deferred)
+        # 取消时还在等待重试的链接
+        for _, url, attempt in deferred:
+            self.cleanup_work_dir(url)
+            self.on_failed({
+                'url': url,
+                'category': 'cancelled',
+                'message': '下载已取消',
+                'attempts': attempt - 1,
+                'download_dir': self.download_dir,
+                'resolution': self.resolution,
+                'mode': self.mode,
+            })
+        self.on_batch_done()
+
+    def download_attempt(self, url, attempt, deferred):
+        """下载一次链接，可以重试的失败放入 deferred 等待之后重试"""
+        self.url = url
+        self.timestamp = self.url_timestamps.setdefault(url, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        if attempt == 1:
+            registry.inc('download_jobs_total')
+        registry.gauge_add('download_active_jobs', 1)
+        retrying = False
+        try:
+            with registry.span('download.job'):
+                self.download_one(url)
+        except Exception as e:
+            category = classify_error(e)
+            delay = backoff_delay(category, attempt)
+            if delay is not None and not self.is_cancelled():
+                registry.inc('download_retries_total')
+                self.on_progress(
+                    f'{ERROR_CATEGORY_NAMES[category]}，{delay:.0f}秒后第{attempt}次重试'
+                    f'（先处理其他链接）: {e}'
+                )
+                deferred.append((time.monotonic() + delay, url, attempt + 1))
+                retrying = True
+                return
+            registry.inc('download_failures_total')
+            registry.inc(f'download_failures_{category}_total')
+            self.on_error(str(e))
+            self.on_failed({
+                'url': url,
+                'category': category,
+                'message': str(e),
+                'attempts': attempt,
+                # 重试失败列表时使用当时的下载选项
+                'download_dir': self.download_dir,
+                'resolution': self.resolution,
+                'mode': self.mode,
+            })
+        finally:
+            registry.gauge_add('download_active_jobs', -1)
+            if not retrying:
+                self.cleanup_work_dir(url)
+
+    def wait_interruptible(self, seconds):
+        """等待指定秒数，期间收到中断请求则提前返回 False"""
+        if seconds > 0:
+            self.cancel_event.wait(seconds)
+        return not self.is_cancelled()
+
+    def download_one(self, url):
+        """下载单个链接并写入.vinfo文件"""
+        self.reset_job_stats()
+        self.work_dir = self.prepare_work_dir(url)
+        if self.content_cache and self.mode != 'subtitles' and self.download_from_cache(url):
+            return
+        ydl_opts = self.build_ydl_opts()
+
+        with ydl_pool.acquire(ydl_opts) as ydl:
+            # 先只解析信息，确认磁盘空间足够后再开始下载；
+            # 不直接处理，以免频道或播放列表链接在下面的检查之前就逐个解析全部视频
+            info = ydl.extract_info(url, download=False, process=False)
+            self.check_single_video(info)
+            info = ydl.process_ie_result(info, download=False)
+            self.check_single_video(info)
+            self.incremental_checksum = len(info.get('requested_formats') or []) <= 1
+            with self.reserve_disk_space(info):
+                info = ydl.process_ie_result(info, download=True)
+                self.save_download(url, ydl, info)
+
+    def check_single_video(self, info):
+        """每个链接只下载一个视频，频道和播放列表链接直接拒绝（不重试）"""
+        if info.get('_type') in ('playlist', 'multi_video'):
+            raise Exception('这是频道或播放列表链接，不能直接下载：请添加为频道订阅，或粘贴其中单个视频的链接')
+
+    def download_from_cache(self, url):
+        """从局域网内容缓存获取视频，缓存中没有或获取失败时返回 False"""
+        try:
+            video_key = video_key_for_url(url)
+            if video_key is None:
+                return False
+            format_key = format_key_for(self.mode, self.resolution)
+            meta = self.content_cache.lookup(video_key, format_key)
+        except ContentCacheError as e:
+            self.on_progress(f'{e}，改为从原网站下载')
+            return False
+        if not meta or not meta.get('checksum'):
+            registry.inc('cache_misses_total')
+            return False
+
+        registry.inc('cache_hits_total')
+        self.on_progress(f"从内容缓存获取: {meta['title']}")
+        file_name = load_yt_dlp().utils.sanitize_filename(f"{meta['title']}_{self.timestamp}.{meta['ext']}")
+        video_path = os.path.join(self.work_dir, file_name)
+        last_report = [0]
+
+        def on_progress(done, total):
+            if self.is_cancelled():
+                raise DownloadCancelled('下载已取消')
+            now = time.monotonic()
+            if now - last_report[0] >= 0.5 or done == total:
+                last_report[0] = now
+                self.on_progress(f'从内容缓存下载: {done * 100 / total:.1f}%')
+
+        try:
+            with self.reserve_disk_space({'filesize': meta['checksum']['size']}):
+                with registry.span('download.cache_fetch'):
+                    checksum = self.content_cache.fetch(video_key, format_key, meta, video_path, on_progress)
+                self.checksums[os.path.abspath(video_path)] = (checksum, file_state(video_path))
+                self.save_download(url, None, meta, video_path=video_path, from_cache=True)
+        except ContentCacheError as e:
+            if os.path.exists(video_path + '.part'):
+                os.remove(video_path + '.part')
+            self.on_progress(f'{e}，改为从原网站下载')
+            return False
+        return True
+
+    def save_download(self, url, ydl, info, video_path=None, from_cache=False):
+        """把下载结果移动到下载目录，写入.vinfo文件并发送完成信号
+
+        从内容缓存获取时 info 为缓存中的 .vinfo 信息，video_path 为获取到的文件。
+        """
+        # 准备视频信息
+        video_info = {
+            'title': info['title'],
+            'url': url,
+            'download_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'resolution': self.resolution if self.mode == 'video' else self.mode,
+            'mode': self.mode,
+            'duration': info.get('duration'),
+            'format': info.get('format'),
+            'channel': info.get('channel', 'Unknown'),
+            'channel_url': info.get('channel_url', ''),
+            'description': info.get('description', ''),
+            'view_count': info.get('view_count'),
+            'like_count': info.get('like_count'),
+            'upload_date': info.get('upload_date')
+        }
+
+        # 文件路径
+        video_path = video_path or self.get_output_path(ydl, info)
+        if self.mode == 'subtitles':
+            video_info['subtitle_files'] = [
+                sub['filepath']
+                for sub in (info.get('requested_subtitles') or {}).values()
+                if sub.get('filepath')
+            ]
+            if not video_info['subtitle_files']:
+                raise Exception('该视频没有可用的字幕')
+            video_path = video_info['subtitle_files'][0]
+
+        # 下载时算好的校验和，文件之后被合并等后处理改写过则不能使用
+        checksum = None
+        if self.mode != 'subtitles':
+            checksum, state = self.checksums.get(os.path.abspath(video_path), (None, None))
+            if checksum and state != file_state(video_path):
+                checksum = None
+
+        # 从临时目录移动到下载目录
+        copy_hash = None
+        if self.work_dir != self.download_dir:
+            with registry.span('download.move'):
+                if self.mode == 'subtitles':
+                    video_info['subtitle_files'] = [
+                        move_into_dir(path, self.download_dir)
+                        for path in video_info['subtitle_files']
+                    ]
+                    video_path = video_info['subtitle_files'][0]
+                else:
+                    # 临时目录会在任务结束后删除，移动前确认 yt-dlp 报告的文件确实存在
+                    if not os.path.isfile(video_path):
+                        raise Exception(f'临时目录中找不到下载的文件: {video_path}')
+                    if checksum is None and device_of(self.work_dir) != device_of(self.download_dir):
+                        # 跨磁盘移动需要复制文件，复制时顺便计算校验和
+                        copy_hash = new_hash()
+                    video_path = move_into_dir(video_path, self.download_dir, copy_hash)
+
+        if self.mode != 'subtitles':
+            if copy_hash is not None:
+                checksum = make_checksum(copy_hash, os.path.getsize(video_path))
+            elif checksum is None:
+                # 合并后的文件由 ffmpeg 写出，只能再读取一次
+                with registry.span('download.checksum'):
+                    checksum = hash_file(video_path)
+            video_info['checksum'] = checksum
+
+        # 创建同名的.vinfo文件
+        vinfo_path = video_path.rsplit('.', 1)[0] + '.vinfo'
+        if self.mode == 'subtitles':
+            # 字幕文件名形如 标题_时间.zh.vtt（标题已被 yt-dlp 处理过），.vinfo 去掉语言后缀和扩展名
+            vinfo_path = video_path.rsplit('.', 2)[0] + '.vinfo'
+        with registry.span('download.vinfo_write'):
+            with open(vinfo_path, 'w', encoding='utf-8') as f:
+                json.dump(video_info, f, ensure_ascii=False, indent=2)
+
+        if self.content_cache and self.mode != 'subtitles' and not from_cache:
+            # 在后台上传到内容缓存，供局域网中的其他机器使用
+            self.content_cache.publish_async(
+                video_key_for(info['extractor_key'], info['id']),
+                format_key_for(self.mode, self.resolution),
+                video_path, video_info,
+            )
+
+        # 发送完成信号
+        result = video_info.copy()
+        result['file_path'] = video_path
+        result['vinfo_path'] = vinfo_path
+        self.on_finished(result)
+
+    def work_dir_for(self, url):
+        job_name = f"{self.url_timestamps[url]}_{hashlib.md5(url.encode('utf-8')).hexdigest()[:12]}"
+        return os.path.join(self.scratch_dir, job_name)
+
+    def prepare_work_dir(self, url):
+        """返回本次下载写入的目录，重试时使用同一个临时目录以便续传"""
+        if not self.scratch_dir:
+            return self.download_dir
+        work_dir = self.work_dir_for(url)
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir
+
+    def cleanup_work_dir(self, url):
+        """删除链接在临时目录中残留的分片和未完成文件
+
+        已经下载完成的文件（例如移动到下载目录时失败）不会删除，保留在临时目录中。
+        """
+        if self.scratch_dir:
+            work_dir = self.work_dir_for(url)
+            kept = remove_partial_files(work_dir)
+            if kept:
+                self.on_progress(f"临时目录中保留了已下载的文件: {work_dir}")
+        self.work_dir = self.download_dir
+
+    def reserve_disk_space(self, info):
+        """根据格式的文件大小预留磁盘空间，空间不足时抛出 InsufficientDiskSpace"""
+        size = 0
+        if self.mode != 'subtitles':
+            # 无法估算大小时只检查保留空间
+            size = estimate_download_size(info) or 0
+        # 需要合并时，音视频分片和合并后的文件会同时存在
+        merging = len(info.get('requested_formats') or []) > 1
+        requirements = {self.work_dir: size * 2 if merging else size}
+        if self.work_dir != self.download_dir and device_of(self.work_dir) != device_of(self.download_dir):
+            requirements[self.download_dir] = size
+        return disk_reservations.reserve(requirements, self.reserve_margin)
+
+    def get_output_path(self, ydl, info):
+        """获取实际输出文件路径
+
+        使用 yt-dlp 报告的路径：标题中的 :|?/ 等字符会在文件名中被替换，不能用标题自己拼接。
+        """
+        downloads = info.get('requested_downloads') or []
+        if downloads and downloads[0].get('filepath'):
+            return downloads[0]['filepath']
+        if info.get('filepath'):
+            return info['filepath']
+        return ydl.prepare_filename(info)
+
+    def cancel(self):
+        """取消下载：正在传输的文件会在下一次进度回调时中止，等待重试的链接立即结束"""
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def progress_hook(self, d):
+        if self.is_cancelled():
+            raise DownloadCancelled('下载已取消')
+        self.record_progress(d)
+        self.track_checksum(d)
+        if d['status'] == 'downloading':
+            progress = d.get('_percent_str', '0%')
+            speed = d.get('_speed_str', 'N/A')
+            self.on_progress(f'下载进度: {progress} 速度: {speed}')
+        elif d['status'] == 'finished':
+            self.on_progress('下载完成，正在处理...')
+
+    def record_progress(self, d):
+        """根据进度回调统计解析/传输耗时、字节数和分片数"""
+        now = time.perf_counter()
+        if self.transfer_start is None and d['status'] in ('downloading', 'finished'):
+            # 第一次收到进度回调之前的时间都花在了信息解析上
+            self.transfer_start = now
+            registry.observe('download.extract', now - self.job_start)
+
+        filename = d.get('filename', '')
+        downloaded = d.get('downloaded_bytes') or 0
+        delta = downloaded - self.file_bytes.get(filename, 0)
+        if delta > 0:
+            registry.inc('download_bytes_total', delta)
+            self.file_bytes[filename] = downloaded
+
+        fragment_index = d.get('fragment_index')
+        if fragment_index and fragment_index != self.file_fragments.get(filename):
+            registry.inc('download_fragments_total')
+            self.file_fragments[filename] = fragment_index
+
+        if d['status'] == 'finished':
+            registry.observe('download.transfer', now - self.transfer_start)
+            self.transfer_start = now
+
+    def track_checksum(self, d):
+        """跟随写入进度增量计算校验和，文件写完时不需要再完整读一遍
+
+        需要合并的下载跳过，合并后的文件在移出临时目录时（或写完后读取一次）计算。
+        """
+        filename = d.get('filename')
+        if not self.incremental_checksum or not filename or d['status'] not in ('downloading', 'finished'):
+            return
+        hasher = self.hashers.setdefault(filename, GrowingFileHasher())
+        try:
+            if d['status'] == 'downloading':
+                hasher.update(d.get('tmpfilename') or filename, d.get('downloaded_bytes'))
+            else:
+                del self.hashers[filename]
+                result = hasher.finish(filename)
+                if result:
+                    self.checksums[os.path.abspath(filename)] = result
+        except OSError as e:
+            # 读取失败时放弃增量计算，保存时再完整读取
+            self.hashers.pop(filename, None)
+            print(f"计算校验和失败: {e}")
+
+    def postprocessor_hook(self, d):
+        """统计合并等后处理步骤的耗时"""
+        if d['status'] == 'started':
+            self.postprocess_start = time.perf_counter()
+        elif d['status'] == 'finished' and self.postprocess_start is not None:
+            name = 'download.merge' if d.get('postprocessor') == 'Merger' else 'download.postprocess'
+            registry.observe(name, time.perf_counter() - self.postprocess_start)
+            self.postprocess_start = None
@@ -0,0 +1,428 @@
+"""本地下载服务
+
+长期运行的后台进程，统一管理所有下载任务和下载历史，通过 Unix 套接字提供
+JSON-RPC 2.0 接口（每条消息一行 JSON）。多个下载器窗口、播放器或脚本连接同一个服务，
+共享并发限制、相同任务自动去重；已结束的任务保留一段时间后从任务列表中删除。
+历史记录通过 history_store 的文件锁写入，与下载器、历史窗口的写入互不覆盖。
+服务运行时由服务定期检查频道订阅（见 subscriptions.py），新视频自动提交为下载任务。
+
+方法：
+    ping                                          检查服务是否运行
+    submit(urls, download_dir, resolution, mode)  提交下载，返回任务ID列表
+    list                                          列出所有任务
+    cancel(job_id)                                取消任务
+    history                                       读取下载历史
+    metrics                                       服务运行指标
+    poll_subscriptions                            立即检查所有订阅，返回新提交的任务ID列表
+    subscribe                                     订阅事件，之后服务持续推送
+                                                  {"method": "event", "params": {...}}
+
+启动::
+
+    python download_service.py --workers 2
+"""
+import argparse
+import collections
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+from download_job import DownloadJob, DOWNLOAD_MODES
+from history_store import read_history, append_history
+from ydl_pool import load_yt_dlp, ydl_pool
+from metrics import registry
+from app_config import load_config
+from service_client import DownloadServiceClient, service_socket_path
+from subscriptions import SubscriptionPoller, group_jobs
+from content_cache import client_from_config
+
+# 同一任务的下载进度事件最短推送间隔（秒）
+PROGRESS_EVENT_INTERVAL = 0.25
+
+# 检查订阅是否到期的间隔（秒）
+SUBSCRIPTION_CHECK_INTERVAL = 60
+
+# 任务结束后的状态
+FINAL_STATES = ('finished', 'failed', 'cancelled')
+
+# 已结束的任务保留这么久（秒）后从任务列表中删除，最多保留 MAX_FINISHED_JOBS 个
+FINISHED_JOB_TTL = 3600
+MAX_FINISHED_JOBS = 200
+
+# JSON-RPC 错误码
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVICE_ERROR = -32000
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class DownloadService:
+    """任务队列、下载工作线程和历史记录"""
+
+    def __init__(self, history_file, max_workers=2):
+        self.history_file = history_file
+        self.max_workers = max_workers
+        self.config = load_config()
+        self.content_cache = client_from_config(self.config)
+        self.jobs = {}
+        # 排队或正在下载的任务 {去重键: 任务ID}
+        self.active_jobs = {}
+        # 已结束的任务 [(结束时间, 任务ID)]，按结束顺序排列
+        self.finished_jobs = collections.deque()
+        # 正在下载的任务 {任务ID: DownloadJob}
+        self.downloads = {}
+        self.job_ids = itertools.count(1)
+        self.job_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.last_progress = {}
+        self.workers = []
+        self.poller = SubscriptionPoller(self.config['subscriptions'])
+
+    def start(self):
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self.worker_loop, name=f'download-worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        threading.Thread(target=self.subscription_loop, name='subscription-poller', daemon=True).start()
+
+    # ---- 事件 ----
+
+    def add_subscriber(self):
+        events = queue.Queue()
+        with self.lock:
+            self.subscribers.add(events)
+        return events
+
+    def remove_subscriber(self, events):
+        with self.lock:
+            self.subscribers.discard(events)
+
+    def broadcast(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            events.put(event)
+
+    def job_view(self, job):
+        """任务的可序列化副本（去掉内部去重键）"""
+        return {name: value for name, value in job.items() if name != 'key'}
+
+    def change_job(self, job, **changes):
+        """修改任务并返回任务视图，调用时必须持有 self.lock
+
+        已结束的任务不再修改（例如被取消后不会再变成下载中或失败），此时返回 None。
+        """
+        if job['state'] in FINAL_STATES:
+            return None
+        job.update(changes)
+        if job['state'] in FINAL_STATES:
+            if self.active_jobs.get(job['key']) == job['id']:
+                del self.active_jobs[job['key']]
+            self.finished_jobs.append((time.monotonic(), job['id']))
+            self.prune_finished_jobs()
+        return self.job_view(job)
+
+    def update_job(self, job_id, **changes):
+        """修改任务并推送 job 事件，任务已结束时不修改并返回 False"""
+        with self.lock:
+            view = self.change_job(self.jobs[job_id], **changes)
+        if view is None:
+            return False
+        self.broadcast({'type': 'job', 'job': view})
+        return True
+
+    def prune_finished_jobs(self):
+        """删除过期的已结束任务，调用时需持有 self.lock"""
+        cutoff = time.monotonic() - FINISHED_JOB_TTL
+        while self.finished_jobs and (len(self.finished_jobs) > MAX_FINISHED_JOBS
+                                      or self.finished_jobs[0][0] < cutoff):
+            _, job_id = self.finished_jobs.popleft()
+            self.jobs.pop(job_id, None)
+
+    # ---- RPC 方法 ----
+
+    def submit(self, urls, download_dir, resolution='1080p', mode='video'):
+        if isinstance(urls, str):
+            urls = [urls]
+        if mode not in DOWNLOAD_MODES.values():
+            raise RpcError(INVALID_PARAMS, f'未知的下载模式: {mode}')
+        os.makedirs(download_dir, exist_ok=True)
+
+        job_ids = []
+        for url in urls:
+            key = (url, os.path.abspath(download_dir), resolution, mode)
+            with self.lock:
+                # 相同的任务正在排队或下载时直接复用
+                existing = self.active_jobs.get(key)
+                if existing is not None:
+                    job_ids.append(existing)
+                    continue
+                job_id = next(self.job_ids)
+                self.active_jobs[key] = job_id
+                self.jobs[job_id] = {
+                    'id': job_id,
+                    'key': key,
+                    'url': url,
+                    'download_dir': download_dir,
+                    'resolution': resolution,
+                    'mode': mode,
+                    'state': 'queued',
+                    'message': '',
+                    'submitted_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    'result': None,
+                    'failure': None,
+                }
+                job_ids.append(job_id)
+            self.job_queue.put(job_id)
+            registry.gauge_add('service_queued_jobs', 1)
+            self.broadcast({'type': 'job', 'job': self.job_view(self.jobs[job_id])})
+        return job_ids
+
+    def list_jobs(self):
+        with self.lock:
+            self.prune_finished_jobs()
+            return [self.job_view(job) for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise RpcError(INVALID_PARAMS, f'任务不存在: {job_id}')
+            if job['state'] in FINAL_STATES:
+                return False
+            download = self.downloads.get(job_id)
+            if download is None:
+                # 还在排队的任务直接结束；和工作线程取出任务在同一把锁内，
+                # 工作线程之后会跳过它，不会再改成下载中
+                failure = self.cancelled_failure(job)
+                view = self.change_job(job, state='cancelled', failure=failure)
+        if download is not None:
+            download.cancel()
+        else:
+            # 发送 failed 事件让客户端知道任务已结束
+            self.poller.mark_failed(job['url'])
+            self.broadcast({'type': 'job', 'job': view})
+            self.broadcast({'type': 'failed', 'job_id': job_id, 'failure': failure})
+        return True
+
+    def cancelled_failure(self, job):
+        return {'url': job['url'], 'category': 'cancelled', 'message': '下载已取消', 'attempts': 0,
+                'download_dir': job['download_dir'], 'resolution': job['resolution'],
+                'mode': job['mode']}
+
+    def history(self):
+        return read_history(self.history_file)
+
+    def poll_subscriptions(self, force=True):
+        """检查订阅并提交新视频的下载任务"""
+        job_ids = []
+        for download_dir, resolution, mode, urls in group_jobs(self.poller.poll(force)):
+            job_ids.extend(self.submit(urls, download_dir, resolution, mode))
+        return job_ids
+
+    # ---- 订阅 ----
+
+    def subscription_loop(self):
+        while True:
+            try:
+                self.poll_subscriptions(force=False)
+            except Exception as e:
+                print(f"检查订阅失败: {e}")
+            time.sleep(SUBSCRIPTION_CHECK_INTERVAL)
+
+    # ---- 下载 ----
+
+    def worker_loop(self):
+        while True:
+            job_id = self.job_queue.get()
+            registry.gauge_add('service_queued_jobs', -1)
+            with self.lock:
+                # 排队期间被取消的任务可能已经从任务列表中删除
+                job = self.jobs.get(job_id)
+                if job is None or job['state'] in FINAL_STATES:
+                    continue
+                download = DownloadJob(
+                    [job['url']], job['download_dir'], job['resolution'], job['mode'],
+                    scratch_dir=self.config['scratch_dir'],
+                    reserve_margin=self.config['disk_reserve_margin_mb'] * 1024 * 1024,
+                    content_cache=self.content_cache,
+                    on_progress=lambda message: self.on_progress(job_id, message),
+                    on_finished=lambda result: self.on_finished(job_id, result),
+                    on_failed=lambda failure: self.on_failed(job_id, failure),
+                )
+                self.downloads[job_id] = download
+                view = self.change_job(job, state='running')
+            self.broadcast({'type': 'job', 'job': view})
+            self.run_job(job_id, download)
+
+    def run_job(self, job_id, download):
+        """在当前工作线程中执行下载，回调也在这个线程中调用"""
+        try:
+            download.run()
+        except Exception as e:
+            job = self.jobs[job_id]
+            self.on_failed(job_id, {'url': job['url'], 'category': 'unknown',
+                                    'message': str(e), 'attempts': 1,
+                                    'download_dir': job['download_dir'],
+                                    'resolution': job['resolution'], 'mode': job['mode']})
+        finally:
+            with self.lock:
+                self.downloads.pop(job_id, None)
+                self.last_progress.pop(job_id, None)
+                job = self.jobs[job_id]
+                unfinished = job['state'] == 'running'
+            if unfinished:
+                # 开始下载前就被取消时 DownloadJob 不会调用任何回调
+                failure = self.cancelled_failure(job)
+                if not download.is_cancelled():
+                    failure.update(category='unknown', message='下载未完成', attempts=1)
+                self.on_failed(job_id, failure)
+
+    def on_progress(self, job_id, message):
+        now = time.monotonic()
+        if message.startswith('下载进度'):
+            # 传输进度回调非常频繁，限制推送频率
+            if now - self.last_progress.get(job_id, 0) < PROGRESS_EVENT_INTERVAL:
+                return
+            self.last_progress[job_id] = now
+        with self.lock:
+            self.jobs[job_id]['message'] = message
+        self.broadcast({'type': 'progress', 'job_id': job_id, 'message': message})
+
+    def on_finished(self, job_id, result):
+        with registry.span('history.save'):
+            try:
+                append_history(self.history_file, result)
+            except Exception as e:
+                print(f"保存历史记录失败: {e}")
+        self.poller.mark_downloaded(result['url'])
+        if self.update_job(job_id, state='finished', result=result):
+            self.broadcast({'type': 'finished', 'job_id': job_id, 'result': result})
+
+    def on_failed(self, job_id, failure):
+        state = 'cancelled' if failure['category'] == 'cancelled' else 'failed'
+        if self.update_job(job_id, state=state, failure=failure):
+            self.poller.mark_failed(failure['url'])
+            self.broadcast({'type': 'failed', 'job_id': job_id, 'failure': failure})
+
+
+class ServiceRequestHandler(socketserver.StreamRequestHandler):
+    """处理一个客户端连接上的 JSON-RPC 请求"""
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self.send({'jsonrpc': '2.0', 'id': None,
+                           'error': {'code': PARSE_ERROR, 'message': '无效的JSON'}})
+                continue
+
+            request_id = request.get('id')
+            method = request.get('method')
+            params = request.get('params') or {}
+            if method == 'subscribe':
+                self.send({'jsonrpc': '2.0', 'id': request_id, 'result': True})
+                self.stream_events(service)
+                return
+
+            try:
+                result = self.dispatch(service, method, params)
+                response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+            except RpcError as e:
+                response = {'jsonrpc': '2.0', 'id': request_id,
+                            'error': {'code': e.code, 'message': str(e)}}
+            except TypeError as e:
+                response = {'jsonrpc': '2.0', 'id': request_id,
+                            'error': {'code': INVALID_PARAMS, 'message': str(e)}}
+            except Exception as e:
+                response = {'jsonrpc': '2.0', 'id': request_id,
+                            'error': {'code': SERVICE_ERROR, 'message': str(e)}}
+            self.send(response)
+
+    def dispatch(self, service, method, params):
+        methods = {
+            'ping': lambda: 'pong',
+            'submit': service.submit,
+            'list': service.list_jobs,
+            'cancel': service.cancel,
+            'history': service.history,
+            'metrics': registry.snapshot,
+            'poll_subscriptions': service.poll_subscriptions,
+        }
+        if method not in methods:
+            raise RpcError(METHOD_NOT_FOUND, f'未知方法: {method}')
+        return methods[method](**params)
+
+    def stream_events(self, service):
+        """持续向订阅者推送事件，直到连接断开"""
+        events = service.add_subscriber()
+        try:
+            while True:
+                event = events.get()
+                self.send({'jsonrpc': '2.0', 'method': 'event', 'params': event})
+        except OSError:
+            pass
+        finally:
+            service.remove_subscriber(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地下载服务')
+    parser.add_argument('--socket', default=service_socket_path(), help='Unix 套接字路径')
+    parser.add_argument('--workers', type=int, default=2, help='同时下载的任务数')
+    parser.add_argument('--history', default='data/history.json', help='下载历史文件')
+    args = parser.parse_args()
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print('当前平台不支持 Unix 套接字，无法启动下载服务')
+        sys.exit(1)
+
+    if os.path.exists(args.socket):
+        if DownloadServiceClient(args.socket).available():
+            print(f'下载服务已在运行: {args.socket}')
+            sys.exit(1)
+        # 上次异常退出留下的套接字文件
+        os.unlink(args.socket)
+    os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+
+    service = DownloadService(args.history, args.workers)
+    # 启动时预加载 yt_dlp，所有客户端共享；YoutubeDL 实例由 ydl_pool 在任务间复用
+    load_yt_dlp()
+    service.start()
+
+    server = socketserver.ThreadingUnixStreamServer(args.socket, ServiceRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f'下载服务已启动: {args.socket}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ydl_pool.clear()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
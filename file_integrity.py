@@ -0,0 +1,270 @@
+"""下载文件的校验和与完整性检查
+
+下载单个文件时跟随 yt-dlp 的进度回调增量计算校验和：每次回调只读取文件新写入的部分
+（刚写入的数据还在页缓存中），文件写完时校验和也同时算完，不需要再完整读一遍。
+需要合并音视频（bestvideo+bestaudio）时不做增量计算，分开的流合并后会被删除；
+合并后的文件由 ffmpeg 写出后计算一次：跨磁盘移出临时目录时在复制过程中计算，否则读取一次。校验和记录在 .vinfo 的 checksum 项中。
+
+校验时多个线程并行重新计算校验和，可以限制总读取速度，避免占满磁盘；
+可选用 ffprobe/ffmpeg 快速检查文件能否正常解码。结果记录在 .vinfo 的 integrity 项中。
+
+命令行::
+
+    python file_integrity.py --workers 4 --max-mb-per-s 200 --probe
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from metrics import registry
+from library_retention import MEDIA_EXTENSIONS, TIME_FORMAT, vinfo_path_for, read_vinfo, update_vinfo
+from disk_space import is_partial_file
+
+CHECKSUM_ALGORITHM = 'sha256'
+
+CHUNK_SIZE = 1024 * 1024
+
+INTEGRITY_STATUS_NAMES = {
+    'ok': '正常',
+    'unchecked': '无校验和',
+    'corrupt': '校验和不符',
+    'truncated': '文件不完整',
+    'unplayable': '无法解码',
+    'error': '读取失败',
+}
+
+# 播放器中标记为损坏的状态
+BROKEN_STATUSES = ('corrupt', 'truncated', 'unplayable', 'error')
+
+
+def new_hash(algorithm=CHECKSUM_ALGORITHM):
+    return hashlib.new(algorithm)
+
+
+def make_checksum(hash_obj, size):
+    """生成写入 .vinfo 的校验和记录"""
+    return {'algorithm': hash_obj.name, 'value': hash_obj.hexdigest(), 'size': size}
+
+
+class GrowingFileHasher:
+    """跟随正在写入的文件增量计算校验和
+
+    每次 update 只读取上次读到的位置之后、已写入的部分。
+    写入量比已读取的还少时说明文件被重新下载，从头开始计算。
+    """
+
+    def __init__(self, algorithm=CHECKSUM_ALGORITHM):
+        self.algorithm = algorithm
+        self.hash = new_hash(algorithm)
+        self.offset = 0
+
+    def update(self, path, written=None):
+        if written is not None and written < self.offset:
+            self.hash = new_hash(self.algorithm)
+            self.offset = 0
+        with open(path, 'rb') as f:
+            f.seek(self.offset)
+            while written is None or self.offset < written:
+                size = CHUNK_SIZE if written is None else min(CHUNK_SIZE, written - self.offset)
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                self.hash.update(chunk)
+                self.offset += len(chunk)
+
+    def finish(self, path):
+        """文件写完后读取剩余部分，返回校验和记录和文件状态（用于判断之后是否被改写）"""
+        self.update(path)
+        stat = os.stat(path)
+        if stat.st_size != self.offset:
+            return None
+        return make_checksum(self.hash, self.offset), (stat.st_size, stat.st_mtime_ns)
+
+
+def file_state(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ReadLimiter:
+    """限制多个线程的总读取速度（字节/秒）"""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def consume(self, nbytes):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + nbytes / self.bytes_per_second
+        if start > now:
+            time.sleep(start - now)
+
+
+def hash_file(path, algorithm=CHECKSUM_ALGORITHM, limiter=None, should_stop=None):
+    """完整读取文件计算校验和，返回校验和记录；should_stop 返回 True 时中止并返回 None"""
+    hash_obj = new_hash(algorithm)
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            if should_stop and should_stop():
+                return None
+            if limiter:
+                limiter.consume(CHUNK_SIZE)
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hash_obj.update(chunk)
+            size += len(chunk)
+    registry.inc('checksum_bytes_read_total', size)
+    return make_checksum(hash_obj, size)
+
+
+def probe_media(path, timeout=120):
+    """用 ffprobe 检查容器，再用 ffmpeg 解码最后几秒，返回错误信息，正常时返回 None
+
+    没有安装 ffprobe/ffmpeg 时跳过检查。
+    """
+    if not (shutil.which('ffprobe') and shutil.which('ffmpeg')):
+        return None
+    commands = [
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        # 文件被截断时结尾的数据无法解码
+        ['ffmpeg', '-v', 'error', '-nostdin', '-sseof', '-3', '-i', path, '-f', 'null', '-'],
+    ]
+    for command in commands:
+        try:
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                    timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return f"{command[0]} 超时"
+        error = result.stderr.decode('utf-8', errors='ignore').strip()
+        if result.returncode != 0 or error:
+            return error.splitlines()[-1] if error else f"{command[0]} 返回码 {result.returncode}"
+    return None
+
+
+def verify_file(video_path, limiter=None, probe=False, should_stop=None):
+    """检查单个视频，返回 {'path', 'status', 'message'}，被中止时返回 None"""
+    if should_stop and should_stop():
+        return None
+    result = {'path': video_path, 'status': 'unchecked', 'message': ''}
+    checksum = (read_vinfo(vinfo_path_for(video_path)) or {}).get('checksum')
+    with registry.span('verify.file'):
+        try:
+            size = os.path.getsize(video_path)
+            if checksum and size < checksum['size']:
+                result.update(status='truncated',
+                              message=f"大小 {size} 字节，应为 {checksum['size']} 字节")
+            elif checksum and size > checksum['size']:
+                result.update(status='corrupt',
+                              message=f"大小 {size} 字节，应为 {checksum['size']} 字节")
+            elif checksum:
+                actual = hash_file(video_path, checksum['algorithm'], limiter, should_stop)
+                if actual is None:
+                    return None
+                if actual['value'] == checksum['value']:
+                    result['status'] = 'ok'
+                else:
+                    result.update(status='corrupt', message=f"{checksum['algorithm']} 不一致")
+            if probe and result['status'] in ('ok', 'unchecked'):
+                error = probe_media(video_path)
+                if error:
+                    result.update(status='unplayable', message=error)
+        except (OSError, ValueError) as e:
+            result.update(status='error', message=str(e))
+    registry.inc('verify_files_total')
+    if result['status'] in BROKEN_STATUSES:
+        registry.inc('verify_broken_total')
+    return result
+
+
+def record_result(result):
+    """把检查结果写入 .vinfo，没有校验和也没有做解码检查的文件不记录"""
+    if result['status'] == 'unchecked' and not result['message']:
+        return
+    update_vinfo(result['path'], integrity={
+        'status': result['status'],
+        'message': result['message'],
+        'checked': datetime.now().strftime(TIME_FORMAT),
+    })
+
+
+def list_media_files(download_dir):
+    if not os.path.isdir(download_dir):
+        return []
+    with os.scandir(download_dir) as it:
+        return [entry.path for entry in it
+                if entry.name.endswith(MEDIA_EXTENSIONS) and not is_partial_file(entry.name)
+                and entry.is_file()]
+
+
+def verify_library(download_dir, workers=4, max_read_bytes_per_second=0, probe=False,
+                   on_result=None, should_stop=None):
+    """并行检查下载目录中的所有视频，返回结果列表
+
+    workers 限制同时读取的文件数，max_read_bytes_per_second 限制总读取速度（0 表示不限制）。
+    每检查完一个文件调用一次 on_result(结果, 已完成数, 总数)。
+    """
+    paths = list_media_files(download_dir)
+    limiter = ReadLimiter(max_read_bytes_per_second) if max_read_bytes_per_second else None
+    results = []
+    with registry.span('verify.library'):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(verify_file, path, limiter, probe, should_stop) for path in paths]
+            for future in as_completed(futures):
+                result = future.result()
+                if result is None:
+                    continue
+                try:
+                    record_result(result)
+                except OSError as e:
+                    print(f"写入校验结果失败: {e}")
+                results.append(result)
+                if on_result:
+                    on_result(result, len(results), len(paths))
+    return results
+
+
+def format_verify_report(results):
+    """把检查结果格式化为文本"""
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    lines = [f"共检查 {len(results)} 个文件: " + "，".join(
+        f"{INTEGRITY_STATUS_NAMES[status]} {count}" for status, count in sorted(counts.items())
+    )]
+    for result in sorted(results, key=lambda r: r['path']):
+        if result['status'] in BROKEN_STATUSES:
+            lines.append(f"  [{INTEGRITY_STATUS_NAMES[result['status']]}] "
+                         f"{os.path.basename(result['path'])}: {result['message']}")
+    return '\n'.join(lines)
+
+
+def main():
+    from app_config import load_config
+
+    config = load_config()['verify']
+    parser = argparse.ArgumentParser(description='检查视频库中的文件是否完整')
+    parser.add_argument('--dir', default=os.path.join(os.getcwd(), 'downloads'), help='下载目录')
+    parser.add_argument('--workers', type=int, default=config['workers'], help='同时检查的文件数')
+    parser.add_argument('--max-mb-per-s', type=float, default=config['max_read_mb_per_s'],
+                        help='总读取速度上限（MB/s），0 表示不限制')
+    parser.add_argument('--probe', action='store_true', default=config['probe'],
+                        help='同时用 ffprobe/ffmpeg 检查能否解码')
+    args = parser.parse_args()
+
+    results = verify_library(args.dir, args.workers, int(args.max_mb_per_s * 1024 * 1024), args.probe)
+    print(format_verify_report(results))
+    return 1 if any(r['status'] in BROKEN_STATUSES for r in results) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
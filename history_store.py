@@ -0,0 +1,63 @@
+"""下载历史记录文件
+
+下载器、下载服务、历史窗口和视频库清理都会改写 data/history.json。
+所有读取-修改-写入都在 update_history 中进行，用 <历史文件>.lock 加跨进程的文件锁，
+写入先写临时文件再重命名，不会互相覆盖对方的修改，也不会留下写了一半的文件。
+"""
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+
+def read_history(history_file):
+    """读取历史记录列表，文件不存在时返回空列表"""
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_history(history_file, history):
+    """写入历史记录列表"""
+    os.makedirs(os.path.dirname(history_file) or '.', exist_ok=True)
+    tmp_path = history_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, history_file)
+
+
+@contextmanager
+def history_lock(history_file):
+    """锁定历史记录文件，其他进程和线程在锁释放前等待"""
+    os.makedirs(os.path.dirname(history_file) or '.', exist_ok=True)
+    with open(history_file + '.lock', 'a+b') as lock_file:
+        if sys.platform == 'win32':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def update_history(history_file, change):
+    """在文件锁内读取历史记录，change(历史列表) 返回新的列表后写回，返回新的列表"""
+    with history_lock(history_file):
+        history = change(read_history(history_file))
+        write_history(history_file, history)
+    return history
+
+
+def append_history(history_file, item):
+    """在历史记录末尾添加一条"""
+    return update_history(history_file, lambda history: history + [item])
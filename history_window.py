@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
                            QTextEdit, QMessageBox)
 from PyQt6.QtCore import Qt
+from history_store import update_history
 
 class HistoryWindow(QDialog):
     """下载历史窗口"""
@@ -97,52 +98,52 @@ class HistoryWindow(QDialog):
             return
 
         try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-
-            now = datetime.now()
-            new_history = []
-
-            for item in history:
-                # 兼容旧版本的历史记录
-                time_str = item.get('download_time')
-                if not time_str and 'timestamp' in item:
-                    # 将旧版本的时间戳转换为新格式
-                    timestamp = item['timestamp']
-                    try:
-                        dt = datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
-                        time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-                    except:
-                        time_str = "未知"
-                
-                if not time_str:
-                    # 如果无法获取时间，保留该记录
-                    new_history.append(item)
-                    continue
+            # 下载器和下载服务可能同时写入，在文件锁内读取并写回
+            update_history(self.history_file, lambda history: self.filter_history(history, period))
+            self.load_history()
+            QMessageBox.information(self, "成功", "历史记录已删除")
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"删除历史记录失败: {str(e)}")
 
+    def filter_history(self, history, period):
+        """返回删除指定时期后剩下的历史记录"""
+        now = datetime.now()
+        new_history = []
+
+        for item in history:
+            # 兼容旧版本的历史记录
+            time_str = item.get('download_time')
+            if not time_str and 'timestamp' in item:
+                # 将旧版本的时间戳转换为新格式
+                timestamp = item['timestamp']
                 try:
-                    download_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-                    keep = True
-
-                    if period == 'today':
-                        keep = not (download_time.date() == now.date())
-                    elif period == 'week':
-                        keep = not (now - download_time <= timedelta(days=7))
-                    elif period == 'month':
-                        keep = not (now - download_time <= timedelta(days=30))
-                    elif period == 'all':
-                        keep = False
-
-                    if keep:
-                        new_history.append(item)
+                    dt = datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+                    time_str = dt.strftime("%Y-%m-%d %H:%M:%S")
                 except:
-                    # 如果日期解析失败，保留该记录
-                    new_history.append(item)
+                    time_str = "未知"
+            
+            if not time_str:
+                # 如果无法获取时间，保留该记录
+                new_history.append(item)
+                continue
 
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(new_history, f, ensure_ascii=False, indent=2)
+            try:
+                download_time = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
+                keep = True
+
+                if period == 'today':
+                    keep = not (download_time.date() == now.date())
+                elif period == 'week':
+                    keep = not (now - download_time <= timedelta(days=7))
+                elif period == 'month':
+                    keep = not (now - download_time <= timedelta(days=30))
+                elif period == 'all':
+                    keep = False
+
+                if keep:
+                    new_history.append(item)
+            except:
+                # 如果日期解析失败，保留该记录
+                new_history.append(item)
 
-            self.load_history()
-            QMessageBox.information(self, "成功", "历史记录已删除")
-        except Exception as e:
-            QMessageBox.warning(self, "错误", f"删除历史记录失败: {str(e)}")
+        return new_history
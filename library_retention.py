@@ -0,0 +1,268 @@
+"""视频库保留策略
+
+根据配置（data/config.json 中的 retention 项）清理下载目录：
+
+    max_total_gb    视频库总大小上限，超出时按最近最少播放的顺序删除（0 表示不限制）
+    max_age_days    超过天数的视频直接删除（0 表示不限制）
+
+固定（pinned）的视频永远不会被删除。播放时间、播放次数和固定状态记录在 .vinfo 文件中，
+删除视频时同时删除 .vinfo 和字幕文件，并从下载历史中移除对应记录。
+yt-dlp 的中间文件（单独的格式流、合并临时文件）和还没有 .vinfo 的新文件可能属于正在进行的下载，
+不参与清理。
+
+命令行::
+
+    python library_retention.py --dry-run
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from metrics import registry
+from history_store import update_history
+from disk_space import is_partial_file
+
+# 视频库中的媒体文件
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm', '.m4a', '.opus', '.mp3')
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 没有 .vinfo 的媒体文件在修改后这么久内视为下载中（秒），下载完成后才会写入 .vinfo
+NEW_FILE_GRACE_SECONDS = 3600
+
+
+def vinfo_path_for(video_path):
+    return video_path.rsplit('.', 1)[0] + '.vinfo'
+
+
+def read_vinfo(vinfo_path):
+    try:
+        with open(vinfo_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def update_vinfo(video_path, **changes):
+    """修改视频的 .vinfo 文件，文件不存在时新建"""
+    vinfo_path = vinfo_path_for(video_path)
+    info = read_vinfo(vinfo_path) or {'title': os.path.basename(video_path)}
+    info.update(changes)
+    tmp_path = vinfo_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, vinfo_path)
+    return info
+
+
+def record_play(video_path):
+    """记录一次播放，保留策略按最近播放时间决定删除顺序"""
+    info = read_vinfo(vinfo_path_for(video_path)) or {}
+    update_vinfo(video_path,
+                 last_played=datetime.now().strftime(TIME_FORMAT),
+                 play_count=info.get('play_count', 0) + 1)
+
+
+def set_pinned(video_path, pinned):
+    update_vinfo(video_path, pinned=bool(pinned))
+
+
+def parse_time(value, default):
+    try:
+        return datetime.strptime(value, TIME_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return default
+
+
+def scan_library(download_dir):
+    """扫描下载目录，返回视频条目列表"""
+    entries = []
+    if not os.path.isdir(download_dir):
+        return entries
+    now = time.time()
+    with os.scandir(download_dir) as it:
+        for entry in it:
+            if not entry.name.endswith(MEDIA_EXTENSIONS) or not entry.is_file():
+                continue
+            if is_partial_file(entry.name):
+                continue
+            stat = entry.stat()
+            info = read_vinfo(vinfo_path_for(entry.path))
+            if info is None:
+                if now - stat.st_mtime < NEW_FILE_GRACE_SECONDS:
+                    continue
+                info = {}
+            downloaded = parse_time(info.get('download_time'), stat.st_mtime)
+            entries.append({
+                'path': entry.path,
+                'size': stat.st_size,
+                'downloaded': downloaded,
+                # 没有播放记录时按下载时间计算
+                'last_used': parse_time(info.get('last_played'), downloaded),
+                'pinned': bool(info.get('pinned')),
+                'subtitle_files': info.get('subtitle_files') or [],
+            })
+    return entries
+
+
+def plan_eviction(entries, max_total_bytes=0, max_age_days=0, exclude=(), now=None):
+    """计算需要删除的条目，返回 [(条目, 原因)]"""
+    now = now or time.time()
+    exclude = {os.path.abspath(path) for path in exclude}
+    candidates = [
+        e for e in entries
+        if not e['pinned'] and os.path.abspath(e['path']) not in exclude
+    ]
+    plan = []
+    evicted = set()
+
+    if max_age_days:
+        cutoff = now - max_age_days * 86400
+        for entry in candidates:
+            if entry['downloaded'] < cutoff:
+                plan.append((entry, 'age'))
+                evicted.add(entry['path'])
+
+    if max_total_bytes:
+        total = sum(e['size'] for e in entries if e['path'] not in evicted)
+        # 最近最少使用的先删除
+        for entry in sorted(candidates, key=lambda e: e['last_used']):
+            if total <= max_total_bytes:
+                break
+            if entry['path'] in evicted:
+                continue
+            plan.append((entry, 'quota'))
+            evicted.add(entry['path'])
+            total -= entry['size']
+    return plan
+
+
+def remove_from_history(history_file, removed_paths):
+    """从下载历史中移除已删除视频的记录"""
+    if not removed_paths or not os.path.exists(history_file):
+        return 0
+    removed = {os.path.normcase(os.path.abspath(path)) for path in removed_paths}
+    count = [0]
+
+    def drop_removed(history):
+        kept = [
+            item for item in history
+            if os.path.normcase(os.path.abspath(item.get('file_path') or '')) not in removed
+        ]
+        count[0] = len(history) - len(kept)
+        return kept
+
+    update_history(history_file, drop_removed)
+    return count[0]
+
+
+def apply_eviction(plan, history_file):
+    """删除计划中的视频及其 .vinfo、字幕文件，并更新下载历史"""
+    removed, errors = [], []
+    for entry, _ in plan:
+        try:
+            os.remove(entry['path'])
+        except OSError as e:
+            errors.append(f"{entry['path']}: {e}")
+            continue
+        removed.append(entry['path'])
+        for extra in [vinfo_path_for(entry['path'])] + entry['subtitle_files']:
+            try:
+                if os.path.exists(extra):
+                    os.remove(extra)
+            except OSError as e:
+                errors.append(f"{extra}: {e}")
+    try:
+        remove_from_history(history_file, removed)
+    except Exception as e:
+        errors.append(f"更新历史记录失败: {e}")
+    registry.inc('retention_evicted_total', len(removed))
+    return removed, errors
+
+
+def run_sweep(download_dir, history_file, policy, dry_run=True, exclude=()):
+    """执行一次清理，返回报告字典"""
+    with registry.span('retention.sweep'):
+        entries = scan_library(download_dir)
+        plan = plan_eviction(
+            entries,
+            max_total_bytes=int(policy.get('max_total_gb', 0) * 1024 ** 3),
+            max_age_days=policy.get('max_age_days', 0),
+            exclude=exclude,
+        )
+        report = {
+            'dry_run': dry_run,
+            'total_files': len(entries),
+            'total_bytes': sum(e['size'] for e in entries),
+            'freed_bytes': sum(e['size'] for e, _ in plan),
+            'plan': [{'path': e['path'], 'size': e['size'], 'reason': reason} for e, reason in plan],
+            'removed': [],
+            'errors': [],
+        }
+        if not dry_run:
+            report['removed'], report['errors'] = apply_eviction(plan, history_file)
+    return report
+
+
+def apply_preview(preview, history_file, exclude=()):
+    """删除预览报告中列出的文件，不重新计算计划，返回报告字典
+
+    预览之后被固定、已不存在或正在播放（exclude）的文件会跳过。
+    """
+    exclude = {os.path.abspath(path) for path in exclude}
+    plan, kept_items, skipped = [], [], []
+    with registry.span('retention.apply'):
+        for item in preview['plan']:
+            info = read_vinfo(vinfo_path_for(item['path'])) or {}
+            if (info.get('pinned') or os.path.abspath(item['path']) in exclude
+                    or not os.path.isfile(item['path'])):
+                skipped.append(item)
+                continue
+            entry = {'path': item['path'], 'size': item['size'],
+                     'subtitle_files': info.get('subtitle_files') or []}
+            plan.append((entry, item['reason']))
+            kept_items.append(item)
+        report = dict(preview, dry_run=False, plan=kept_items, skipped=skipped,
+                      freed_bytes=sum(item['size'] for item in kept_items))
+        report['removed'], report['errors'] = apply_eviction(plan, history_file)
+    return report
+
+
+def format_report(report):
+    """把清理报告格式化为文本"""
+    reasons = {'age': '超过保留天数', 'quota': '超出容量上限'}
+    action = '将删除' if report['dry_run'] else '已删除'
+    lines = [
+        f"视频库: {report['total_files']} 个文件，共 {report['total_bytes'] / 1024 ** 3:.2f} GB",
+        f"{action} {len(report['plan'])} 个文件，释放 {report['freed_bytes'] / 1024 ** 3:.2f} GB",
+    ]
+    for item in report['plan']:
+        lines.append(f"  [{reasons[item['reason']]}] {os.path.basename(item['path'])} "
+                     f"({item['size'] / 1024 ** 2:.1f} MB)")
+    for item in report.get('skipped', []):
+        lines.append(f"  [已跳过] {os.path.basename(item['path'])}（已固定、已不存在或正在播放）")
+    for error in report['errors']:
+        lines.append(f"  删除失败: {error}")
+    return '\n'.join(lines)
+
+
+def main():
+    from app_config import load_config
+
+    config = load_config()
+    parser = argparse.ArgumentParser(description='按保留策略清理视频库')
+    parser.add_argument('--dir', default=os.path.join(os.getcwd(), 'downloads'), help='下载目录')
+    parser.add_argument('--history', default='data/history.json', help='下载历史文件')
+    parser.add_argument('--max-total-gb', type=float, default=config['retention']['max_total_gb'])
+    parser.add_argument('--max-age-days', type=float, default=config['retention']['max_age_days'])
+    parser.add_argument('--dry-run', action='store_true', help='只显示将要删除的文件')
+    args = parser.parse_args()
+
+    policy = {'max_total_gb': args.max_total_gb, 'max_age_days': args.max_age_days}
+    report = run_sweep(args.dir, args.history, policy, dry_run=args.dry_run)
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""运行指标：计时区间(span)、计数器和仪表(gauge)
+
+所有指标保存在进程内的全局注册表中，线程安全。可以导出为 Prometheus 文本格式
+或 JSON 文件，也可以通过环境变量 YTDL_METRICS_PORT 开启本地 HTTP 端点::
+
+    from metrics import registry
+
+    with registry.span('download.extract'):
+        ...
+    registry.inc('download_bytes_total', 1024)
+    registry.gauge_add('download_active_jobs', 1)
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT_ENV = 'YTDL_METRICS_PORT'
+
+
+def metric_name(name):
+    """把 download.extract 之类的名称转换为 Prometheus 兼容名称"""
+    return 'ytdl_' + name.replace('.', '_').replace('-', '_')
+
+
+class SpanStats:
+    """某个计时区间的累计统计"""
+    __slots__ = ('count', 'total', 'max', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 6),
+            'mean_s': round(self.total / self.count, 6) if self.count else 0.0,
+            'max_s': round(self.max, 6),
+            'last_s': round(self.last, 6),
+        }
+
+
+class MetricsRegistry:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.spans = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1):
+        """计数器增加"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge_set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def gauge_add(self, name, delta):
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + delta
+
+    def observe(self, name, seconds):
+        """记录一次计时区间的耗时"""
+        with self.lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = SpanStats()
+            stats.add(seconds)
+
+    @contextmanager
+    def span(self, name):
+        """统计代码块耗时，出现异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """返回当前所有指标的副本"""
+        with self.lock:
+            return {
+                'uptime_s': round(time.time() - self.started, 3),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'spans': {name: stats.as_dict() for name, stats in self.spans.items()},
+            }
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            lines += [f'# TYPE {metric_name(name)} counter', f'{metric_name(name)} {value}']
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines += [f'# TYPE {metric_name(name)} gauge', f'{metric_name(name)} {value}']
+        for name, stats in sorted(snapshot['spans'].items()):
+            base = metric_name(name) + '_seconds'
+            lines += [
+                f'# TYPE {base} summary',
+                f'{base}_count {stats["count"]}',
+                f'{base}_sum {stats["total_s"]}',
+                f'# TYPE {base}_max gauge',
+                f'{base}_max {stats["max_s"]}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def export_to_file(self, path):
+        """写入指标文件，.json 后缀写 JSON，其它写 Prometheus 文本"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.json'):
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.spans.clear()
+            self.started = time.time()
+
+
+registry = MetricsRegistry()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """/metrics 返回 Prometheus 文本，/metrics.json 返回 JSON"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            body = registry.to_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path == '/metrics.json':
+            body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """在后台线程中启动指标端点，返回服务器对象"""
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_http_server_from_env():
+    """如果设置了 YTDL_METRICS_PORT 环境变量则启动指标端点"""
+    port = os.environ.get(METRICS_PORT_ENV)
+    if not port:
+        return None
+    try:
+        return start_http_server(int(port))
+    except Exception as e:
+        print(f"启动指标端点失败: {e}")
+        return None
@@ -0,0 +1,118 @@
+"""下载服务客户端
+
+下载服务（download_service.py）在本机 Unix 套接字上提供 JSON-RPC 2.0 接口，
+每条消息是一行 JSON。下载器和播放器在服务运行时作为客户端连接，
+否则退回到进程内下载。这个模块不依赖 Qt，下载服务自身也使用它；
+界面中接收事件的线程在 service_events.py 中。
+"""
+import json
+import os
+import socket
+import threading
+
+SERVICE_SOCKET_ENV = 'YTDL_SERVICE_SOCKET'
+DEFAULT_SOCKET_PATH = os.path.join('data', 'download_service.sock')
+
+
+def service_socket_path():
+    """下载服务套接字路径，可用环境变量 YTDL_SERVICE_SOCKET 覆盖"""
+    return os.path.abspath(os.environ.get(SERVICE_SOCKET_ENV, DEFAULT_SOCKET_PATH))
+
+
+class ServiceError(Exception):
+    """下载服务返回的错误或连接失败"""
+
+
+class DownloadServiceClient:
+    """下载服务客户端，每次调用使用一个短连接"""
+
+    def __init__(self, socket_path=None, timeout=10):
+        self.socket_path = socket_path or service_socket_path()
+        self.timeout = timeout
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def connect(self, timeout=None):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ServiceError('当前平台不支持 Unix 套接字')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ServiceError(f'无法连接下载服务: {e}')
+        return sock
+
+    def available(self):
+        """下载服务是否正在运行"""
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            self.call('ping')
+            return True
+        except ServiceError:
+            return False
+
+    def request(self, method, params):
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+        message = {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+        return request_id, (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def call(self, method, **params):
+        """调用服务方法并返回结果"""
+        request_id, data = self.request(method, params)
+        sock = self.connect(self.timeout)
+        try:
+            sock.sendall(data)
+            with sock.makefile('r', encoding='utf-8') as reader:
+                line = reader.readline()
+        except OSError as e:
+            raise ServiceError(f'与下载服务通信失败: {e}')
+        finally:
+            sock.close()
+
+        if not line:
+            raise ServiceError('下载服务关闭了连接')
+        try:
+            response = json.loads(line)
+        except ValueError as e:
+            raise ServiceError(f'下载服务返回了无效的响应: {e}')
+        if not isinstance(response, dict) or ('result' not in response and 'error' not in response):
+            raise ServiceError('下载服务返回了无效的响应')
+        if 'error' in response:
+            error = response['error']
+            message = error.get('message') if isinstance(error, dict) else None
+            raise ServiceError(message or '未知错误')
+        return response['result']
+
+    def submit(self, urls, download_dir, resolution='1080p', mode='video'):
+        """提交下载任务，返回任务ID列表"""
+        return self.call('submit', urls=list(urls), download_dir=download_dir,
+                         resolution=resolution, mode=mode)
+
+    def list_jobs(self):
+        return self.call('list')
+
+    def cancel(self, job_id):
+        return self.call('cancel', job_id=job_id)
+
+    def history(self):
+        return self.call('history')
+
+    def poll_subscriptions(self):
+        """让服务立即检查所有订阅，返回新提交的任务ID列表"""
+        return self.call('poll_subscriptions')
+
+    def subscribe(self, sock):
+        """在已连接的套接字上订阅事件，逐个返回事件字典，连接断开时结束"""
+        _, data = self.request('subscribe', {})
+        sock.sendall(data)
+        with sock.makefile('r', encoding='utf-8') as reader:
+            for line in reader:
+                message = json.loads(line)
+                if message.get('method') == 'event':
+                    yield message['params']
+
@@ -0,0 +1,37 @@
+"""下载服务事件线程
+
+在 QThread 中订阅下载服务推送的事件，供下载器和播放器界面使用。
+"""
+import socket
+from PyQt6.QtCore import QThread, pyqtSignal
+from service_client import ServiceError
+
+
+class ServiceEventThread(QThread):
+    """在后台接收下载服务推送的事件，通过 event 信号转发到界面线程"""
+    event = pyqtSignal(dict)
+    disconnected = pyqtSignal()
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.sock = None
+
+    def run(self):
+        try:
+            self.sock = self.client.connect()
+            for event in self.client.subscribe(self.sock):
+                self.event.emit(event)
+        except (OSError, ValueError, ServiceError):
+            pass
+        finally:
+            self.disconnected.emit()
+
+    def stop(self):
+        """断开订阅连接并等待线程结束"""
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.wait()
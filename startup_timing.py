@@ -0,0 +1,75 @@
+"""启动耗时测量
+
+使用 --startup-timing 参数启动下载器或播放器时，记录模块导入、窗口创建、
+首次绘制等时间点（相对于主模块开始执行的时刻），以 JSON 输出到标准输出后退出::
+
+    python youtube_downloader.py --startup-timing
+"""
+import json
+import sys
+import time
+from PyQt6.QtCore import QObject, QEvent, QTimer
+
+STARTUP_TIMING_FLAG = '--startup-timing'
+
+# 没有等到全部时间点时的最长等待时间（毫秒）
+STARTUP_TIMING_TIMEOUT_MS = 30000
+
+
+def startup_timing_enabled():
+    return STARTUP_TIMING_FLAG in sys.argv
+
+
+class FirstPaintHook(QObject):
+    """窗口第一次绘制完成后调用 callback（只调用一次）"""
+
+    def __init__(self, widget, callback):
+        super().__init__(widget)
+        self.widget = widget
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if obj is self.widget and event.type() == QEvent.Type.Paint:
+            self.widget.removeEventFilter(self)
+            # 等本次绘制处理完再执行
+            QTimer.singleShot(0, self.callback)
+        return False
+
+
+class StartupTimer(QObject):
+    """记录启动过程中的各个时间点，等到 expected 中的时间点全部出现后输出并退出"""
+
+    def __init__(self, app, start_time, expected=('first_paint',)):
+        super().__init__()
+        self.app = app
+        self.start_time = start_time
+        self.expected = set(expected)
+        self.marks = {}
+        self.reported = False
+        app.installEventFilter(self)
+        QTimer.singleShot(STARTUP_TIMING_TIMEOUT_MS, self.report)
+
+    def mark(self, name):
+        """记录时间点（只记录第一次）"""
+        if name not in self.marks:
+            self.marks[name] = round(time.perf_counter() - self.start_time, 6)
+        if self.expected.issubset(self.marks):
+            # 等当前事件处理完再输出，避免在绘制过程中退出
+            QTimer.singleShot(0, self.report)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and 'first_paint' not in self.marks:
+            self.mark('first_paint')
+        return False
+
+    def report(self):
+        """输出结果并退出应用"""
+        if self.reported:
+            return
+        self.reported = True
+        self.app.removeEventFilter(self)
+        missing = sorted(self.expected - set(self.marks))
+        print(json.dumps({'marks': self.marks, 'missing': missing}))
+        sys.stdout.flush()
+        self.app.quit()
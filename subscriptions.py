@@ -0,0 +1,339 @@
+"""频道订阅
+
+订阅列表保存在 data/subscriptions.json，每个订阅是一个频道或播放列表，带有各自的
+保存位置、分辨率和下载模式。
+
+已经见过的视频记录在 data/download_archive.txt，格式与 yt-dlp 的 --download-archive
+相同（每行“提取器 视频ID”），也可以直接配合 yt-dlp --download-archive --break-on-existing 使用。
+轮询时只做平铺解析，频道的视频列表按从新到旧逐页加载，遇到第一个已记录的视频
+（已在存档或待下载列表中）就停止，所以每次轮询只请求包含新视频的那几页，不会重新解析整个频道。
+
+发现的新视频先记入订阅的待下载列表（subscriptions.json 中的 backlog），每次轮询从中取最旧的
+max_new_per_poll 个交给下载，下载成功后才记入存档并从列表中删除。因此超出数量限制的视频和
+下载失败的视频都会在之后的轮询中继续下载；连续排队 MAX_BACKLOG_ATTEMPTS 次仍未成功的视频放弃并记入存档。
+
+新订阅第一次检查时会把频道中已有的视频全部记入存档（只下载最新的 initial_backfill 个），
+之后只下载新发布的视频。
+
+只支持新视频出现在列表开头的频道和播放列表（频道的视频页、按添加时间倒序的列表）。
+新视频追加在末尾的播放列表不受支持：轮询在开头遇到已记录的视频就会停止，看不到末尾的新视频。
+"""
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from metrics import registry
+from ydl_pool import load_yt_dlp
+
+SUBSCRIPTIONS_FILE = os.path.join('data', 'subscriptions.json')
+ARCHIVE_FILE = os.path.join('data', 'download_archive.txt')
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 待下载列表中的视频排队这么多次仍未下载成功时放弃
+MAX_BACKLOG_ATTEMPTS = 5
+
+# 频道首页会列出“视频”“Shorts”“直播”等多个标签页，订阅时使用按发布时间排列的视频页
+CHANNEL_HOME_PATTERN = re.compile(
+    r'^(https?://(?:www\.|m\.)?youtube\.com/(?:@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+))/?$'
+)
+
+
+def normalize_subscription_url(url):
+    url = url.strip()
+    match = CHANNEL_HOME_PATTERN.match(url)
+    if match:
+        return match.group(1) + '/videos'
+    return url
+
+
+def load_subscriptions(subscriptions_file=SUBSCRIPTIONS_FILE):
+    if not os.path.exists(subscriptions_file):
+        return []
+    with open(subscriptions_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_subscriptions(subscriptions, subscriptions_file=SUBSCRIPTIONS_FILE):
+    os.makedirs(os.path.dirname(subscriptions_file) or '.', exist_ok=True)
+    tmp_path = subscriptions_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(subscriptions, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, subscriptions_file)
+
+
+def add_subscription(url, download_dir, resolution='1080p', mode='video',
+                     subscriptions_file=SUBSCRIPTIONS_FILE):
+    """添加订阅，已订阅的链接只更新保存位置和下载选项"""
+    url = normalize_subscription_url(url)
+    subscriptions = load_subscriptions(subscriptions_file)
+    for subscription in subscriptions:
+        if subscription['url'] == url:
+            subscription.update(download_dir=download_dir, resolution=resolution, mode=mode)
+            break
+    else:
+        subscriptions.append({
+            'url': url,
+            'title': '',
+            'download_dir': download_dir,
+            'resolution': resolution,
+            'mode': mode,
+            'enabled': True,
+            'initialized': False,
+            'added': datetime.now().strftime(TIME_FORMAT),
+            'last_checked': None,
+            'last_new_count': 0,
+            'last_error': '',
+        })
+    save_subscriptions(subscriptions, subscriptions_file)
+    return url
+
+
+def remove_subscription(url, subscriptions_file=SUBSCRIPTIONS_FILE):
+    subscriptions = load_subscriptions(subscriptions_file)
+    kept = [subscription for subscription in subscriptions if subscription['url'] != url]
+    save_subscriptions(kept, subscriptions_file)
+    return len(kept) != len(subscriptions)
+
+
+def archive_id_for(entry):
+    """与 yt-dlp 下载存档相同的记录格式：小写的提取器名 + 视频ID"""
+    extractor = entry.get('ie_key') or entry.get('extractor_key')
+    if not extractor or not entry.get('id'):
+        return None
+    return f"{extractor.lower()} {entry['id']}"
+
+
+class DownloadArchive:
+    """yt-dlp 格式的下载存档，多个线程可以同时使用"""
+
+    def __init__(self, archive_file=ARCHIVE_FILE):
+        self.archive_file = archive_file
+        self.lock = threading.Lock()
+        self.ids = set()
+        if os.path.exists(archive_file):
+            with open(archive_file, 'r', encoding='utf-8') as f:
+                self.ids = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, archive_id):
+        with self.lock:
+            return archive_id in self.ids
+
+    def add(self, archive_ids):
+        with self.lock:
+            new_ids = [archive_id for archive_id in archive_ids if archive_id not in self.ids]
+            if not new_ids:
+                return
+            os.makedirs(os.path.dirname(self.archive_file) or '.', exist_ok=True)
+            with open(self.archive_file, 'a', encoding='utf-8') as f:
+                f.writelines(f"{archive_id}\n" for archive_id in new_ids)
+            self.ids.update(new_ids)
+
+
+def list_new_entries(url, archive, known_ids=()):
+    """平铺解析频道或播放列表，返回 (标题, 新视频列表)，新视频按从新到旧排列
+
+    遇到存档或 known_ids 中已有的视频即停止，后面的分页不会被请求。
+    """
+    yt_dlp = load_yt_dlp()
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    new_entries = []
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # process=False 时 entries 是按页懒加载的生成器
+        info = ydl.extract_info(url, download=False, process=False)
+        while info.get('_type') in ('url', 'url_transparent'):
+            info = ydl.extract_info(info['url'], download=False, ie_key=info.get('ie_key'),
+                                    process=False)
+        for entry in info.get('entries') or []:
+            archive_id = entry and archive_id_for(entry)
+            if archive_id is None:
+                continue
+            if archive_id in archive or archive_id in known_ids:
+                registry.inc('subscription_stopped_at_known_total')
+                break
+            new_entries.append({
+                'archive_id': archive_id,
+                'url': entry.get('webpage_url') or entry.get('url'),
+                'title': entry.get('title') or '',
+            })
+    return info.get('title') or '', new_entries
+
+
+class SubscriptionPoller:
+    """定期检查订阅，返回需要下载的新视频
+
+    已交给下载但还没有完成的视频记录在 pending 中，避免重复排队。
+    下载完成后调用 mark_downloaded 记入存档并从待下载列表中删除；
+    失败时调用 mark_failed，视频留在待下载列表中，下次轮询会再次排队。
+    """
+
+    def __init__(self, settings, subscriptions_file=SUBSCRIPTIONS_FILE, archive_file=ARCHIVE_FILE):
+        self.settings = settings
+        self.subscriptions_file = subscriptions_file
+        self.archive = DownloadArchive(archive_file)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()
+        # 轮询和下载完成回调都会改写订阅文件
+        self.file_lock = threading.Lock()
+
+    def is_due(self, subscription, now):
+        if not subscription.get('enabled', True):
+            return False
+        if not subscription.get('last_checked'):
+            return True
+        last_checked = datetime.strptime(subscription['last_checked'], TIME_FORMAT).timestamp()
+        return now - last_checked >= self.settings['poll_interval_minutes'] * 60
+
+    def poll(self, force=False):
+        """检查到期的订阅（force 为 True 时检查全部），返回下载任务列表
+
+        每个任务为 {'url', 'title', 'download_dir', 'resolution', 'mode'}，同一订阅中旧的视频排在前面。
+        """
+        # 下载服务和界面可能同时触发检查
+        with self.poll_lock:
+            now = time.time()
+            try:
+                subscriptions = load_subscriptions(self.subscriptions_file)
+            except Exception as e:
+                print(f"读取订阅列表失败: {e}")
+                return []
+            jobs = []
+            updates = {}
+            for subscription in subscriptions:
+                if not (force or self.is_due(subscription, now)):
+                    continue
+                try:
+                    with registry.span('subscription.poll'):
+                        new_jobs, changes = self.poll_one(subscription)
+                except Exception as e:
+                    print(f"检查订阅失败: {subscription['url']}: {e}")
+                    new_jobs, changes = [], {'last_error': str(e)}
+                changes['last_checked'] = datetime.now().strftime(TIME_FORMAT)
+                updates[subscription['url']] = changes
+                jobs.extend(new_jobs)
+            if updates:
+                self.save_updates(updates)
+            return jobs
+
+    def poll_one(self, subscription):
+        """检查一个订阅，返回 (下载任务, 对订阅记录的修改)
+
+        修改中的 discovered 和 queued 由 save_updates 合并到最新的待下载列表中。
+        """
+        registry.inc('subscription_polls_total')
+        initialized = subscription.get('initialized', False)
+        backlog = subscription.get('backlog') or []
+        # 待下载列表中的视频也算已记录，之前的分页已经读过
+        known_ids = {item['archive_id'] for item in backlog}
+        title, entries = list_new_entries(subscription['url'], self.archive, known_ids)
+        discovered = list(reversed(entries))
+        if not initialized:
+            # 第一次检查时已有的视频全部记入存档，只保留最新的几个
+            backfill = self.settings['initial_backfill']
+            skipped = len(discovered) - min(backfill, len(discovered))
+            self.archive.add([entry['archive_id'] for entry in discovered[:skipped]])
+            discovered = discovered[skipped:]
+
+        # 从最旧的开始，每次最多交给下载 max_new_per_poll 个，其余留到之后的轮询
+        max_new = self.settings['max_new_per_poll']
+        jobs = []
+        queued = []
+        given_up = []
+        with self.lock:
+            for item in backlog + [dict(entry, attempts=0) for entry in discovered]:
+                if max_new and len(jobs) >= max_new:
+                    break
+                if item['url'] in self.pending or item['archive_id'] in self.archive:
+                    continue
+                if item.get('attempts', 0) >= MAX_BACKLOG_ATTEMPTS:
+                    given_up.append(item)
+                    continue
+                self.pending[item['url']] = item['archive_id']
+                queued.append(item['archive_id'])
+                jobs.append({
+                    'url': item['url'],
+                    'title': item['title'],
+                    'download_dir': subscription['download_dir'],
+                    'resolution': subscription.get('resolution', '1080p'),
+                    'mode': subscription.get('mode', 'video'),
+                })
+        if given_up:
+            print(f"订阅 {subscription['url']} 中 {len(given_up)} 个视频多次下载失败，不再尝试: "
+                  + ", ".join(item['url'] for item in given_up))
+            self.archive.add([item['archive_id'] for item in given_up])
+
+        registry.inc('subscription_new_videos_total', len(discovered))
+        changes = {'initialized': True, 'last_new_count': len(discovered), 'last_error': '',
+                   'discovered': discovered, 'queued': queued}
+        if title:
+            changes['title'] = title
+        return jobs, changes
+
+    def save_updates(self, updates):
+        """重新读取订阅文件后只更新检查结果，期间添加或删除的订阅不会被覆盖"""
+        with self.file_lock:
+            try:
+                subscriptions = load_subscriptions(self.subscriptions_file)
+                for subscription in subscriptions:
+                    changes = dict(updates.get(subscription['url'], {}))
+                    discovered = changes.pop('discovered', [])
+                    queued = set(changes.pop('queued', []))
+                    subscription.update(changes)
+                    backlog = subscription.get('backlog') or []
+                    known_ids = {item['archive_id'] for item in backlog}
+                    backlog += [dict(entry, attempts=0) for entry in discovered
+                                if entry['archive_id'] not in known_ids]
+                    for item in backlog:
+                        if item['archive_id'] in queued:
+                            item['attempts'] = item.get('attempts', 0) + 1
+                    # 期间下载完成（已记入存档）的视频不再保留
+                    subscription['backlog'] = [item for item in backlog
+                                               if item['archive_id'] not in self.archive]
+                save_subscriptions(subscriptions, self.subscriptions_file)
+            except Exception as e:
+                print(f"保存订阅列表失败: {e}")
+
+    def mark_downloaded(self, url):
+        """视频下载成功，记入存档并从待下载列表中删除
+
+        手动重试成功的订阅视频已经不在 pending 中，按链接在待下载列表中查找。
+        """
+        with self.lock:
+            archive_id = self.pending.pop(url, None)
+        if archive_id:
+            # 刚排队的视频可能还没有写入待下载列表，先直接记入存档
+            self.archive.add([archive_id])
+        with self.file_lock:
+            try:
+                subscriptions = load_subscriptions(self.subscriptions_file)
+                archive_ids = set()
+                for subscription in subscriptions:
+                    backlog = subscription.get('backlog') or []
+                    archive_ids.update(item['archive_id'] for item in backlog if item['url'] == url)
+                    subscription['backlog'] = [item for item in backlog if item['url'] != url]
+                if archive_ids:
+                    self.archive.add(archive_ids)
+                    save_subscriptions(subscriptions, self.subscriptions_file)
+            except Exception as e:
+                print(f"保存订阅列表失败: {e}")
+
+    def mark_failed(self, url):
+        with self.lock:
+            self.pending.pop(url, None)
+
+
+def group_jobs(jobs):
+    """按 (保存位置, 分辨率, 模式) 分组，返回 [(保存位置, 分辨率, 模式, [链接])]"""
+    groups = {}
+    for job in jobs:
+        key = (job['download_dir'], job['resolution'], job['mode'])
+        groups.setdefault(key, []).append(job['url'])
+    return [key + (urls,) for key, urls in groups.items()]
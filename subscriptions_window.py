@@ -0,0 +1,137 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit,
+                           QLabel, QTreeWidget, QTreeWidgetItem, QHeaderView, QMessageBox)
+from PyQt6.QtCore import pyqtSignal
+from subscriptions import load_subscriptions, add_subscription, remove_subscription
+
+MODE_NAMES = {'video': '视频', 'audio': '仅音频', 'subtitles': '仅字幕'}
+
+class SubscriptionsWindow(QDialog):
+    """订阅管理窗口
+
+    新订阅使用下载器当前的保存位置、分辨率和下载模式。
+    """
+    check_requested = pyqtSignal()
+
+    def __init__(self, download_dir, resolution, mode):
+        super().__init__()
+        self.download_dir = download_dir
+        self.resolution = resolution
+        self.mode = mode
+        self.setup_ui()
+        self.load_subscriptions()
+
+    def setup_ui(self):
+        """设置UI界面"""
+        self.setWindowTitle("频道订阅")
+        self.setMinimumSize(800, 400)
+
+        layout = QVBoxLayout(self)
+
+        # 添加订阅
+        add_layout = QHBoxLayout()
+        add_layout.addWidget(QLabel("频道/播放列表URL:"))
+        self.url_input = QLineEdit()
+        self.url_input.setPlaceholderText("新视频将下载到当前保存位置，使用当前的分辨率和模式")
+        add_layout.addWidget(self.url_input)
+        self.add_button = QPushButton("添加订阅")
+        self.add_button.clicked.connect(self.add_subscription)
+        add_layout.addWidget(self.add_button)
+        layout.addLayout(add_layout)
+
+        # 订阅列表
+        self.subscription_list = QTreeWidget()
+        self.subscription_list.setHeaderLabels(["频道", "URL", "保存位置", "模式", "上次检查", "状态"])
+        header = self.subscription_list.header()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        for column in range(2, 6):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.subscription_list)
+
+        # 按钮区域
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        self.check_button = QPushButton("立即检查")
+        self.check_button.clicked.connect(self.check_requested.emit)
+        buttons_layout.addWidget(self.check_button)
+        self.remove_button = QPushButton("删除订阅")
+        self.remove_button.clicked.connect(self.remove_subscription)
+        buttons_layout.addWidget(self.remove_button)
+        layout.addLayout(buttons_layout)
+
+        self.setStyleSheet("""
+            QPushButton {
+                background-color: #2b5b84;
+                color: white;
+                border: none;
+                padding: 8px 15px;
+                border-radius: 4px;
+            }
+            QPushButton:hover {
+                background-color: #3d7ab3;
+            }
+            QLineEdit {
+                padding: 8px;
+                border: 1px solid #ccc;
+                border-radius: 4px;
+            }
+        """)
+
+    def load_subscriptions(self):
+        """加载订阅列表"""
+        self.subscription_list.clear()
+        try:
+            subscriptions = load_subscriptions()
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"读取订阅列表失败: {str(e)}")
+            return
+        for subscription in subscriptions:
+            if subscription.get('last_error'):
+                status = f"检查失败: {subscription['last_error']}"
+            elif subscription.get('last_checked'):
+                status = f"新视频 {subscription.get('last_new_count', 0)} 个"
+                backlog = subscription.get('backlog') or []
+                if backlog:
+                    status += f"，待下载 {len(backlog)} 个"
+            else:
+                status = "等待第一次检查"
+            mode = MODE_NAMES.get(subscription.get('mode'), subscription.get('mode'))
+            if subscription.get('mode') == 'video':
+                mode = f"{mode} {subscription.get('resolution', '')}"
+            item = QTreeWidgetItem([
+                subscription.get('title') or '',
+                subscription['url'],
+                subscription['download_dir'],
+                mode,
+                subscription.get('last_checked') or '',
+                status,
+            ])
+            item.setToolTip(5, status)
+            self.subscription_list.addTopLevelItem(item)
+
+    def add_subscription(self):
+        """添加订阅"""
+        url = self.url_input.text().strip()
+        if not url:
+            QMessageBox.warning(self, "错误", "请输入频道或播放列表URL")
+            return
+        try:
+            add_subscription(url, self.download_dir, self.resolution, self.mode)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"添加订阅失败: {str(e)}")
+            return
+        self.url_input.clear()
+        self.load_subscriptions()
+
+    def remove_subscription(self):
+        """删除选中的订阅"""
+        item = self.subscription_list.currentItem()
+        if item is None:
+            QMessageBox.warning(self, "提示", "请先选择要删除的订阅")
+            return
+        try:
+            remove_subscription(item.text(1))
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"删除订阅失败: {str(e)}")
+            return
+        self.load_subscriptions()
@@ -0,0 +1,391 @@
+"""播放器视频列表的数据模型
+
+视频列表使用 QTreeView + VideoLibraryModel：
+- 每个视频只保存一个轻量的 VideoEntry，不创建任何控件，显示文本在绘制时才生成
+- 大小、下载日期保存为数值，排序按数值比较
+- 行数很多时通过 canFetchMore/fetchMore 分批交给视图
+- 目录扫描只读取文件系统信息，.vinfo 文件由 VinfoLoaderThread 在后台读取后再更新到模型
+- 可按频道分组显示
+"""
+import json
+import os
+from datetime import datetime
+from PyQt6.QtCore import Qt, QAbstractItemModel, QModelIndex, QThread, pyqtSignal
+from PyQt6.QtGui import QFont, QColor
+from library_retention import MEDIA_EXTENSIONS, vinfo_path_for
+from file_integrity import BROKEN_STATUSES, INTEGRITY_STATUS_NAMES
+
+# 每次交给视图的行数
+FETCH_BATCH_SIZE = 2000
+
+# 后台读取 .vinfo 时每批发送的条目数
+VINFO_BATCH_SIZE = 500
+
+COLUMNS = ["文件名", "大小", "下载日期"]
+
+# 返回排序用原始值（字节数、时间戳）的数据角色
+SORT_ROLE = Qt.ItemDataRole.UserRole + 1
+
+UNKNOWN_CHANNEL = "未知频道"
+
+
+def format_size(size_in_bytes):
+    """格式化文件大小"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_in_bytes < 1024:
+            return f"{size_in_bytes:.2f} {unit}"
+        size_in_bytes /= 1024
+    return f"{size_in_bytes:.2f} TB"
+
+
+class VideoEntry:
+    """列表中的一个视频"""
+    __slots__ = ('file_name', 'path', 'size', 'timestamp', 'channel', 'pinned', 'integrity')
+
+    def __init__(self, file_name, path, size, timestamp):
+        self.file_name = file_name
+        self.path = path
+        self.size = size
+        self.timestamp = timestamp
+        self.channel = UNKNOWN_CHANNEL
+        self.pinned = False
+        # 最近一次校验结果 {'status', 'message', 'checked'}，没有校验过为 None
+        self.integrity = None
+
+    @property
+    def broken(self):
+        return bool(self.integrity) and self.integrity.get('status') in BROKEN_STATUSES
+
+
+class VideoGroup:
+    """分组显示时的一个频道"""
+    __slots__ = ('channel', 'entries', 'size')
+
+    def __init__(self, channel, entries):
+        self.channel = channel
+        self.entries = entries
+        self.size = sum(entry.size for entry in entries)
+
+
+def scan_video_entries(download_dir):
+    """只用文件系统信息扫描下载目录，下载日期暂时使用文件修改时间"""
+    entries = []
+    if not os.path.isdir(download_dir):
+        return entries
+    with os.scandir(download_dir) as it:
+        for dir_entry in it:
+            if not dir_entry.name.endswith(MEDIA_EXTENSIONS):
+                continue
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            entries.append(VideoEntry(dir_entry.name, dir_entry.path, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def read_vinfo_fields(video_path):
+    """读取列表需要的 .vinfo 字段，没有 .vinfo 或读取失败时返回 None"""
+    vinfo_path = vinfo_path_for(video_path)
+    try:
+        with open(vinfo_path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    fields = {
+        'channel': info.get('channel') or UNKNOWN_CHANNEL,
+        'pinned': bool(info.get('pinned')),
+        'integrity': info.get('integrity'),
+    }
+    try:
+        fields['timestamp'] = datetime.strptime(
+            info.get('download_time', ''), "%Y-%m-%d %H:%M:%S"
+        ).timestamp()
+    except ValueError:
+        pass
+    return fields
+
+
+class VinfoLoaderThread(QThread):
+    """在后台读取 .vinfo 文件，分批发送 {视频路径: 字段}"""
+    loaded = pyqtSignal(dict)
+
+    def __init__(self, paths):
+        super().__init__()
+        self.paths = paths
+
+    def run(self):
+        batch = {}
+        for path in self.paths:
+            if self.isInterruptionRequested():
+                return
+            fields = read_vinfo_fields(path)
+            if fields:
+                batch[path] = fields
+            if len(batch) >= VINFO_BATCH_SIZE:
+                self.loaded.emit(batch)
+                batch = {}
+        if batch:
+            self.loaded.emit(batch)
+
+
+class VideoLibraryModel(QAbstractItemModel):
+    """视频列表模型，支持平铺和按频道分组两种显示方式
+
+    平铺时顶层行是视频；分组时顶层行是频道，视频是它的子行。
+    子行的 internalId 为所属频道行号 + 1，顶层行为 0。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.entries_by_path = {}
+        self.groups = []
+        self.grouped = False
+        self.fetched = 0
+        self.sort_column = 2
+        self.sort_order = Qt.SortOrder.DescendingOrder
+
+    # ---- 数据 ----
+
+    def set_entries(self, entries):
+        """替换全部视频"""
+        self.beginResetModel()
+        self.entries = entries
+        self.entries_by_path = {entry.path: entry for entry in entries}
+        self.apply_sort()
+        self.rebuild_groups()
+        self.fetched = min(len(entries), FETCH_BATCH_SIZE)
+        self.endResetModel()
+
+    def apply_vinfo(self, batch):
+        """用后台读取到的 .vinfo 信息更新视频"""
+        for path, fields in batch.items():
+            entry = self.entries_by_path.get(path)
+            if entry is None:
+                continue
+            entry.channel = fields['channel']
+            entry.pinned = fields['pinned']
+            entry.integrity = fields['integrity']
+            entry.timestamp = fields.get('timestamp', entry.timestamp)
+        self.emit_all_changed()
+
+    def finish_loading(self):
+        """.vinfo 全部读取完成后按新的日期和频道重新排序、分组"""
+        self.beginResetModel()
+        self.apply_sort()
+        self.rebuild_groups()
+        self.endResetModel()
+
+    def set_pinned(self, entry, pinned):
+        entry.pinned = pinned
+        self.emit_all_changed()
+
+    def set_grouped(self, grouped):
+        if grouped == self.grouped:
+            return
+        self.beginResetModel()
+        self.grouped = grouped
+        self.rebuild_groups()
+        self.endResetModel()
+
+    def emit_all_changed(self):
+        """通知视图刷新可见区域（视图只会重绘可见的行）"""
+        if self.grouped:
+            for row, group in enumerate(self.groups):
+                parent = self.index(row, 0)
+                if group.entries:
+                    self.dataChanged.emit(
+                        self.index(0, 0, parent),
+                        self.index(len(group.entries) - 1, len(COLUMNS) - 1, parent)
+                    )
+        elif self.fetched:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.fetched - 1, len(COLUMNS) - 1))
+
+    def rebuild_groups(self):
+        if not self.grouped:
+            self.groups = []
+            return
+        by_channel = {}
+        for entry in self.entries:
+            by_channel.setdefault(entry.channel, []).append(entry)
+        reverse = self.sort_order == Qt.SortOrder.DescendingOrder
+        if self.sort_column == 1:
+            key = lambda group: group.size
+        elif self.sort_column == 2:
+            key = lambda group: max(entry.timestamp for entry in group.entries)
+        else:
+            key = lambda group: group.channel.lower()
+        self.groups = sorted(
+            (VideoGroup(channel, entries) for channel, entries in by_channel.items()),
+            key=key, reverse=reverse
+        )
+
+    def apply_sort(self):
+        keys = {
+            0: lambda entry: entry.file_name.lower(),
+            1: lambda entry: entry.size,
+            2: lambda entry: entry.timestamp,
+        }
+        self.entries.sort(key=keys[self.sort_column],
+                          reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+
+    def entry_for_index(self, index):
+        """返回索引对应的视频，频道行返回 None"""
+        if not index.isValid():
+            return None
+        if self.grouped:
+            if index.internalId() == 0:
+                return None
+            return self.groups[index.internalId() - 1].entries[index.row()]
+        return self.entries[index.row()]
+
+    def index_for_path(self, path):
+        """根据视频路径查找索引，用于刷新后恢复选中项"""
+        if self.grouped:
+            for group_row, group in enumerate(self.groups):
+                for row, entry in enumerate(group.entries):
+                    if entry.path == path:
+                        return self.index(row, 0, self.index(group_row, 0))
+            return QModelIndex()
+        for row, entry in enumerate(self.entries):
+            if entry.path == path:
+                while row >= self.fetched and self.canFetchMore(QModelIndex()):
+                    self.fetchMore(QModelIndex())
+                return self.index(row, 0)
+        return QModelIndex()
+
+    # ---- QAbstractItemModel 接口 ----
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if parent.isValid():
+            return self.createIndex(row, column, parent.row() + 1)
+        return self.createIndex(row, column, 0)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return len(self.groups) if self.grouped else self.fetched
+        if self.grouped and parent.internalId() == 0:
+            return len(self.groups[parent.row()].entries)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(COLUMNS)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self.grouped and self.fetched < len(self.entries)
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        count = min(FETCH_BATCH_SIZE, len(self.entries) - self.fetched)
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        column = index.column()
+        entry = self.entry_for_index(index)
+
+        if entry is None:
+            group = self.groups[index.row()]
+            if role == Qt.ItemDataRole.DisplayRole:
+                if column == 0:
+                    return f"{group.channel} ({len(group.entries)})"
+                if column == 1:
+                    return format_size(group.size)
+            elif role == Qt.ItemDataRole.FontRole and column == 0:
+                font = QFont()
+                font.setBold(True)
+                return font
+            return None
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return entry.file_name
+            if column == 1:
+                return format_size(entry.size)
+            return datetime.fromtimestamp(entry.timestamp).strftime("%Y-%m-%d %H:%M")
+        if role == SORT_ROLE:
+            return (entry.file_name, entry.size, entry.timestamp)[column]
+        if role == Qt.ItemDataRole.FontRole and column == 0 and entry.pinned:
+            # 固定的视频加粗显示
+            font = QFont()
+            font.setBold(True)
+            return font
+        if role == Qt.ItemDataRole.ForegroundRole and entry.broken:
+            # 校验发现损坏的视频标红
+            return QColor('#c0392b')
+        if role == Qt.ItemDataRole.ToolTipRole and column == 0:
+            tips = []
+            if entry.broken:
+                status = INTEGRITY_STATUS_NAMES.get(entry.integrity['status'], entry.integrity['status'])
+                tips.append(f"文件损坏（{status}）: {entry.integrity.get('message', '')}")
+            if entry.pinned:
+                tips.append("已固定，不会被自动清理")
+            return '\n'.join(tips) or None
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # 排序只改变行的顺序：按视频（分组时频道行按频道）重新映射持久索引，
+        # 视图中的选中项和当前项跟随移动，不会像重置模型那样被清空
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        keys = [self.row_key(index) for index in old_indexes]
+        self.sort_column = column
+        self.sort_order = order
+        self.apply_sort()
+        self.rebuild_groups()
+        positions = self.row_positions()
+        new_indexes = []
+        for key, index in zip(keys, old_indexes):
+            position = positions.get(key)
+            if position is None:
+                # 排到了还没有交给视图的行
+                new_indexes.append(QModelIndex())
+                continue
+            group_row, row = position
+            parent = QModelIndex() if group_row is None else self.index(group_row, 0)
+            new_indexes.append(self.index(row, index.column(), parent))
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def row_key(self, index):
+        """索引所在行的标识：频道行为频道名，视频行为视频对象的 id"""
+        if self.grouped and index.internalId() == 0:
+            return self.groups[index.row()].channel
+        return id(self.entry_for_index(index))
+
+    def row_positions(self):
+        """{行标识: (频道行号或 None, 行号)}，只包含视图中已有的行"""
+        positions = {}
+        if self.grouped:
+            for group_row, group in enumerate(self.groups):
+                positions[group.channel] = (None, group_row)
+                for row, entry in enumerate(group.entries):
+                    positions[id(entry)] = (group_row, row)
+        else:
+            for row in range(self.fetched):
+                positions[id(self.entries[row])] = (None, row)
+        return positions
@@ -1,15 +1,75 @@
+import time
+STARTUP_TIME = time.perf_counter()
 import sys
 import os
 import json
 import subprocess
 import webbrowser
-from datetime import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QPushButton, QLabel, QFileDialog,
-                           QTreeWidget, QTreeWidgetItem, QMessageBox, QDialog, QTextBrowser,
-                           QHeaderView)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from video_info_window import VideoInfoWindow  # 添加导入语句到文件顶部
+                           QTreeView, QMessageBox, QDialog, QTextBrowser,
+                           QHeaderView, QCheckBox)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
+from metrics import registry, start_http_server_from_env
+from startup_timing import StartupTimer, FirstPaintHook, startup_timing_enabled
+from service_client import DownloadServiceClient
+from service_events import ServiceEventThread
+from app_config import load_config
+from library_retention import record_play, set_pinned, run_sweep, apply_preview, format_report
+from video_library_model import VideoLibraryModel, VinfoLoaderThread, scan_video_entries
+from file_integrity import verify_library, format_verify_report, INTEGRITY_STATUS_NAMES
+
+class RetentionSweepThread(QThread):
+    """在后台按保留策略扫描并清理视频库
+
+    给出 preview（预览报告）时只删除预览中列出的文件，不重新计算计划。
+    """
+    done = pyqtSignal(dict)
+
+    def __init__(self, download_dir, history_file, policy, dry_run=True, exclude=(), preview=None):
+        super().__init__()
+        self.download_dir = download_dir
+        self.history_file = history_file
+        self.policy = policy
+        self.dry_run = dry_run
+        self.exclude = list(exclude)
+        self.preview = preview
+
+    def run(self):
+        try:
+            if self.preview is not None:
+                report = apply_preview(self.preview, self.history_file, exclude=self.exclude)
+            else:
+                report = run_sweep(self.download_dir, self.history_file, self.policy,
+                                   dry_run=self.dry_run, exclude=self.exclude)
+        except Exception as e:
+            report = {'error': str(e)}
+        self.done.emit(report)
+
+class VerifyThread(QThread):
+    """在后台并行校验视频库中的文件"""
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(list)
+
+    def __init__(self, download_dir, verify_config):
+        super().__init__()
+        self.download_dir = download_dir
+        self.verify_config = verify_config
+
+    def run(self):
+        try:
+            results = verify_library(
+                self.download_dir,
+                workers=self.verify_config['workers'],
+                max_read_bytes_per_second=int(self.verify_config['max_read_mb_per_s'] * 1024 * 1024),
+                probe=self.verify_config['probe'],
+                on_result=lambda result, done, total: self.progress.emit(done, total),
+                should_stop=self.isInterruptionRequested,
+            )
+        except Exception as e:
+            print(f"校验视频库失败: {e}")
+            results = []
+        self.done.emit(results)
 
 class FFplayThread(QThread):
     """FFplay播放线程"""
@@ -82,13 +142,37 @@ class FFplayThread(QThread):
                 self.process = None
 
 class PlayerWindow(QMainWindow):
-    """播放器主窗口"""
+    """播放器主窗口
+
+    每次扫描下载目录后发送 list_scanned 信号（列表已显示），.vinfo 信息全部读取完成后发送 list_loaded 信号。
+    """
+    list_scanned = pyqtSignal()
+    list_loaded = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.play_thread = None
         self.current_video = None
+        self.metrics_file = 'data/metrics_player.prom'
+        self.history_file = 'data/history.json'
+        self.service_events = None
+        self.sweep_thread = None
+        self.vinfo_loader = None
+        self.verify_thread = None
+        config = load_config()
+        self.retention = config['retention']
+        self.verify_config = config['verify']
         self.setup_ui()
-        self.load_video_list()
+        # 首次绘制后再扫描视频目录和连接下载服务，避免大目录和连接超时阻塞窗口显示
+        # （singleShot(0) 可能在第一次绘制之前执行）
+        FirstPaintHook(self, self.load_video_list)
+        FirstPaintHook(self, self.attach_to_service)
+
+        # 配置了保留策略时定期在后台清理视频库
+        self.sweep_timer = QTimer(self)
+        self.sweep_timer.timeout.connect(self.start_background_sweep)
+        if self.retention['max_total_gb'] or self.retention['max_age_days']:
+            self.sweep_timer.start(int(self.retention['sweep_interval_minutes'] * 60 * 1000))
 
     def setup_ui(self):
         """设置UI界面"""
@@ -122,14 +206,28 @@ class PlayerWindow(QMainWindow):
         layout.addLayout(dir_layout)
 
         # 视频列表
+        list_header_layout = QHBoxLayout()
         list_label = QLabel("视频列表:")
-        layout.addWidget(list_label)
+        list_header_layout.addWidget(list_label)
+        list_header_layout.addStretch()
+        self.group_checkbox = QCheckBox("按频道分组")
+        self.group_checkbox.toggled.connect(self.video_model_grouping_changed)
+        list_header_layout.addWidget(self.group_checkbox)
+        layout.addLayout(list_header_layout)
         
-        # 使用QTreeWidget替代QListWidget
-        self.video_list = QTreeWidget()
-        self.video_list.setHeaderLabels(["文件名", "大小", "下载日期"])
+        # 使用模型/视图显示视频列表，大量视频时只绘制可见行
+        self.video_model = VideoLibraryModel(self)
+        self.video_list = QTreeView()
+        self.video_list.setModel(self.video_model)
+        self.video_list.setRootIsDecorated(False)
+        self.video_list.setUniformRowHeights(True)  # 行高一致，滚动时不需要逐行计算
         self.video_list.setAlternatingRowColors(True)  # 交替行颜色
-        self.video_list.itemSelectionChanged.connect(self.on_selection_changed)  # 添加选择变化事件
+        self.video_list.setSortingEnabled(True)
+        self.video_list.sortByColumn(self.video_model.sort_column, self.video_model.sort_order)
+        self.video_list.selectionModel().selectionChanged.connect(self.on_selection_changed)  # 添加选择变化事件
+        # 排序后选中项可能排到还没有加载的行而被取消选中，这时不会发送 selectionChanged
+        self.video_model.layoutChanged.connect(self.on_selection_changed)
+        self.video_list.doubleClicked.connect(self.play_selected_video)
         
         # 设置列宽
         header = self.video_list.header()
@@ -175,6 +273,22 @@ class PlayerWindow(QMainWindow):
         self.info_button.setEnabled(False)
         right_controls_layout.addWidget(self.info_button)
 
+        # 固定按钮：固定的视频不会被保留策略删除
+        self.pin_button = QPushButton("固定")
+        self.pin_button.clicked.connect(self.toggle_pinned)
+        self.pin_button.setEnabled(False)
+        right_controls_layout.addWidget(self.pin_button)
+
+        # 视频库清理按钮
+        self.cleanup_button = QPushButton("清理视频库")
+        self.cleanup_button.clicked.connect(self.preview_cleanup)
+        right_controls_layout.addWidget(self.cleanup_button)
+
+        # 校验按钮：重新计算校验和，找出损坏或不完整的文件
+        self.verify_button = QPushButton("校验文件")
+        self.verify_button.clicked.connect(self.start_verify)
+        right_controls_layout.addWidget(self.verify_button)
+
         controls_layout.addLayout(right_controls_layout)
         layout.addLayout(controls_layout)
 
@@ -198,23 +312,23 @@ class PlayerWindow(QMainWindow):
             QPushButton:disabled {
                 background-color: #cccccc;
             }
-            QTreeWidget {
+            QTreeView {
                 border: 1px solid #ccc;
                 border-radius: 4px;
                 padding: 5px;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 height: 30px;  /* 增加项目高度 */
                 border-bottom: 1px solid #eee;  /* 添加底部边框 */
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected {
                 background-color: #2b5b84;  /* 选中项的背景色 */
                 color: white;  /* 选中项的文字颜色 */
             }
-            QTreeWidget::item:hover {
+            QTreeView::item:hover {
                 background-color: #e0e0e0;  /* 悬停项的背景色 */
             }
-            QTreeWidget::item:selected:hover {
+            QTreeView::item:selected:hover {
                 background-color: #3d7ab3;  /* 选中项悬停时的背景色 */
             }
             QHeaderView::section {
@@ -232,91 +346,93 @@ class PlayerWindow(QMainWindow):
 
     def on_selection_changed(self):
         """处理视频选择变化"""
-        selected_items = self.video_list.selectedItems()
-        has_selection = len(selected_items) > 0
+        entry = self.selected_entry()
+        has_selection = entry is not None
         
         # 更新按钮状态
         self.play_button.setEnabled(has_selection)
         self.info_button.setEnabled(has_selection)
         self.open_original_button.setEnabled(has_selection)
-
-    def format_size(self, size_in_bytes):
-        """格式化文件大小"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size_in_bytes < 1024:
-                return f"{size_in_bytes:.2f} {unit}"
-            size_in_bytes /= 1024
-        return f"{size_in_bytes:.2f} TB"
+        self.pin_button.setEnabled(has_selection)
+        self.pin_button.setText("取消固定" if has_selection and entry.pinned else "固定")
+
+    def video_model_grouping_changed(self, grouped):
+        """切换按频道分组显示"""
+        selected_path = self.selected_video_path()
+        self.video_model.set_grouped(grouped)
+        self.video_list.setRootIsDecorated(grouped)
+        if selected_path:
+            index = self.video_model.index_for_path(selected_path)
+            if index.isValid():
+                self.video_list.scrollTo(index)
+                self.video_list.setCurrentIndex(index)
+        self.on_selection_changed()
 
     def load_video_list(self):
         """加载视频列表"""
-        self.video_list.clear()
-        downloads_dir = self.dir_display.text()
-        
-        if os.path.exists(downloads_dir):
-            for file in os.listdir(downloads_dir):
-                if file.endswith(('.mp4', '.mkv', '.avi', '.mov')):
-                    video_path = os.path.join(downloads_dir, file)
-                    vinfo_path = video_path.rsplit('.', 1)[0] + '.vinfo'
-                    
-                    # 创建列表项
-                    item = QTreeWidgetItem()
-                    item.setText(0, file)  # 文件名
-                    
-                    # 尝试从.vinfo文件获取信息
-                    try:
-                        if os.path.exists(vinfo_path):
-                            with open(vinfo_path, 'r', encoding='utf-8') as f:
-                                info = json.load(f)
-                                
-                                # 获取文件大小
-                                file_size = os.path.getsize(video_path)
-                                item.setText(1, self.format_size(file_size))
-                                
-                                # 获取下载日期
-                                download_time = info.get('download_time', '')
-                                if download_time:
-                                    try:
-                                        # 转换时间格式
-                                        dt = datetime.strptime(download_time, "%Y-%m-%d %H:%M:%S")
-                                        formatted_time = dt.strftime("%Y-%m-%d %H:%M")
-                                        item.setText(2, formatted_time)
-                                    except ValueError:
-                                        item.setText(2, download_time)
-                        else:
-                            # 如果没有.vinfo文件，显示文件系统信息
-                            file_size = os.path.getsize(video_path)
-                            item.setText(1, self.format_size(file_size))
-                            
-                            # 使用文件修改时间
-                            mtime = os.path.getmtime(video_path)
-                            dt = datetime.fromtimestamp(mtime)
-                            item.setText(2, dt.strftime("%Y-%m-%d %H:%M"))
-                            
-                    except Exception as e:
-                        print(f"加载视频信息时出错: {e}")
-                        # 出错时显示基本文件信息
-                        try:
-                            file_size = os.path.getsize(video_path)
-                            item.setText(1, self.format_size(file_size))
-                            mtime = os.path.getmtime(video_path)
-                            dt = datetime.fromtimestamp(mtime)
-                            item.setText(2, dt.strftime("%Y-%m-%d %H:%M"))
-                        except:
-                            item.setText(1, "未知")
-                            item.setText(2, "未知")
-                    
-                    self.video_list.addTopLevelItem(item)
+        with registry.span('player.scan'):
+            self.scan_video_list()
+
+    def scan_video_list(self):
+        """扫描下载目录，.vinfo 信息在后台读取"""
+        if self.vinfo_loader:
+            self.vinfo_loader.requestInterruption()
+            self.vinfo_loader.wait()
+            self.vinfo_loader = None
+
+        selected_path = self.selected_video_path()
+        entries = scan_video_entries(self.dir_display.text())
+        self.video_model.set_entries(entries)
+        registry.inc('player_scanned_files_total', len(entries))
+        if selected_path:
+            index = self.video_model.index_for_path(selected_path)
+            if index.isValid():
+                self.video_list.setCurrentIndex(index)
+
+        if entries:
+            self.vinfo_loader = VinfoLoaderThread([entry.path for entry in entries])
+            self.vinfo_loader.loaded.connect(self.video_model.apply_vinfo)
+            loader = self.vinfo_loader
+            self.vinfo_loader.finished.connect(lambda: self.vinfo_loading_finished(loader))
+            self.vinfo_loader.start()
+        self.list_scanned.emit()
+        if not entries:
+            self.list_loaded.emit()
+
+    def vinfo_loading_finished(self, loader):
+        """.vinfo 读取完成，按真实下载日期和频道重新排序"""
+        if loader is self.vinfo_loader and not loader.isInterruptionRequested():
+            selected_path = self.selected_video_path()
+            self.video_model.finish_loading()
+            if selected_path:
+                self.video_list.setCurrentIndex(self.video_model.index_for_path(selected_path))
+            self.on_selection_changed()
+            self.list_loaded.emit()
+
+    def selected_entry(self):
+        """当前选中的视频，未选中或选中的是频道行时返回 None"""
+        return self.video_model.entry_for_index(self.video_list.currentIndex())
+
+    def selected_video_path(self):
+        entry = self.selected_entry()
+        return entry.path if entry else None
 
     def play_selected_video(self):
         """播放选中的视频"""
-        item = self.video_list.currentItem()
-        if item is None:
+        entry = self.selected_entry()
+        if entry is None:
             QMessageBox.warning(self, "提示", "请先选择要播放的视频")
             return
 
-        video_path = os.path.join(self.dir_display.text(), item.text(0))  # 使用当前目录
-        self.play_video(video_path)
+        if entry.broken:
+            status = INTEGRITY_STATUS_NAMES.get(entry.integrity['status'], entry.integrity['status'])
+            reply = QMessageBox.question(
+                self, "文件损坏", f"该视频上次校验结果为“{status}”，仍要播放吗？"
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+
+        self.play_video(entry.path)
 
     def select_directory(self):
         """选择目录"""
@@ -348,10 +464,16 @@ class PlayerWindow(QMainWindow):
             self.stop_video()
 
         self.current_video = video_path
-        self.play_thread = FFplayThread(video_path)
-        self.play_thread.error.connect(self.handle_error)
-        self.play_thread.finished.connect(self.playback_finished)
-        self.play_thread.start()
+        try:
+            record_play(video_path)
+        except Exception as e:
+            print(f"记录播放时间失败: {e}")
+        with registry.span('player.launch'):
+            self.play_thread = FFplayThread(video_path)
+            self.play_thread.error.connect(self.handle_error)
+            self.play_thread.finished.connect(self.playback_finished)
+            self.play_thread.start()
+        registry.inc('player_plays_total')
 
         # 启用相关按钮
         self.stop_button.setEnabled(True)
@@ -373,6 +495,7 @@ class PlayerWindow(QMainWindow):
 
     def handle_error(self, error_message):
         """错误处理"""
+        registry.inc('player_errors_total')
         QMessageBox.critical(self, "错误", f"播放错误: {error_message}")
         self.stop_button.setEnabled(False)
 
@@ -382,12 +505,11 @@ class PlayerWindow(QMainWindow):
 
     def show_video_info(self):
         """显示视频信息"""
-        item = self.video_list.currentItem()
-        if not item:
+        video_path = self.selected_video_path()
+        if not video_path:
             QMessageBox.warning(self, "提示", "请先选择一个视频")
             return
 
-        video_path = os.path.join(self.dir_display.text(), item.text(0))
         vinfo_path = video_path.rsplit('.', 1)[0] + '.vinfo'
 
         if not os.path.exists(vinfo_path):
@@ -395,6 +517,7 @@ class PlayerWindow(QMainWindow):
             return
 
         try:
+            from video_info_window import VideoInfoWindow
             info_window = VideoInfoWindow(vinfo_path)
             info_window.exec()
         except Exception as e:
@@ -402,12 +525,11 @@ class PlayerWindow(QMainWindow):
 
     def open_original_url(self):
         """打开视频原始URL"""
-        item = self.video_list.currentItem()
-        if not item:
+        video_path = self.selected_video_path()
+        if not video_path:
             QMessageBox.warning(self, "提示", "请先选择一个视频")
             return
 
-        video_path = os.path.join(self.dir_display.text(), item.text(0))
         vinfo_path = video_path.rsplit('.', 1)[0] + '.vinfo'
 
         if not os.path.exists(vinfo_path):
@@ -425,13 +547,152 @@ class PlayerWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"打开URL时出错: {str(e)}")
 
+    def attach_to_service(self):
+        """连接本地下载服务，下载完成时自动刷新视频列表"""
+        client = DownloadServiceClient()
+        if not client.available():
+            return
+        self.service_events = ServiceEventThread(client)
+        self.service_events.event.connect(self.on_service_event)
+        self.service_events.start()
+
+    def on_service_event(self, event):
+        """处理下载服务推送的事件"""
+        if event['type'] != 'finished':
+            return
+        file_dir = os.path.dirname(os.path.abspath(event['result'].get('file_path', '')))
+        if file_dir == os.path.abspath(self.dir_display.text()):
+            self.load_video_list()
+
+    def toggle_pinned(self):
+        """固定/取消固定选中的视频"""
+        entry = self.selected_entry()
+        if entry is None:
+            return
+        pinned = not entry.pinned
+        try:
+            set_pinned(entry.path, pinned)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"修改固定状态失败: {str(e)}")
+            return
+        self.video_model.set_pinned(entry, pinned)
+        self.on_selection_changed()
+
+    def start_sweep(self, dry_run, on_done, preview=None):
+        """启动后台清理线程，正在播放的视频不会被删除
+
+        已有清理在进行时返回 False。
+        """
+        if self.sweep_thread and self.sweep_thread.isRunning():
+            return False
+        exclude = [self.current_video] if self.current_video else []
+        self.sweep_thread = RetentionSweepThread(
+            self.dir_display.text(), self.history_file, self.retention, dry_run, exclude, preview
+        )
+        self.sweep_thread.done.connect(on_done)
+        self.sweep_thread.start()
+        return True
+
+    def start_background_sweep(self):
+        self.start_sweep(False, self.background_sweep_finished)
+
+    def background_sweep_finished(self, report):
+        """定期清理完成，有文件被删除时刷新列表"""
+        if report.get('removed'):
+            self.load_video_list()
+
+    def preview_cleanup(self):
+        """按保留策略预览将要删除的视频（不实际删除）"""
+        if not (self.retention['max_total_gb'] or self.retention['max_age_days']):
+            QMessageBox.information(
+                self, "提示",
+                "未设置保留策略，请在 data/config.json 的 retention 项中设置 max_total_gb 或 max_age_days"
+            )
+            return
+        if not self.start_sweep(True, self.cleanup_preview_ready):
+            QMessageBox.information(self, "提示", "正在清理视频库，请稍后再试")
+            return
+        self.cleanup_button.setEnabled(False)
+
+    def cleanup_preview_ready(self, report):
+        """显示清理预览，确认后执行删除"""
+        self.cleanup_button.setEnabled(True)
+        if 'error' in report:
+            QMessageBox.warning(self, "错误", f"扫描视频库失败: {report['error']}")
+            return
+        if not report['plan']:
+            QMessageBox.information(self, "提示", format_report(report))
+            return
+        reply = QMessageBox.question(self, "清理视频库", format_report(report) + "\n\n确定删除吗？")
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        # 只删除确认过的文件，不重新计算计划
+        if self.start_sweep(False, self.cleanup_finished, preview=report):
+            self.cleanup_button.setEnabled(False)
+        else:
+            QMessageBox.information(self, "提示", "正在清理视频库，请稍后再试")
+
+    def cleanup_finished(self, report):
+        self.cleanup_button.setEnabled(True)
+        if 'error' in report:
+            QMessageBox.warning(self, "错误", f"清理视频库失败: {report['error']}")
+            return
+        self.load_video_list()
+        QMessageBox.information(self, "完成", format_report(report))
+
+    def start_verify(self):
+        """在后台校验视频库中的文件"""
+        if self.verify_thread and self.verify_thread.isRunning():
+            return
+        self.verify_button.setEnabled(False)
+        self.verify_thread = VerifyThread(self.dir_display.text(), self.verify_config)
+        self.verify_thread.progress.connect(
+            lambda done, total: self.verify_button.setText(f"校验中 {done}/{total}")
+        )
+        self.verify_thread.done.connect(self.verify_finished)
+        self.verify_thread.start()
+
+    def verify_finished(self, results):
+        """校验完成，刷新列表以标记损坏的文件"""
+        self.verify_button.setText("校验文件")
+        self.verify_button.setEnabled(True)
+        if self.verify_thread.isInterruptionRequested():
+            return
+        self.load_video_list()
+        QMessageBox.information(self, "校验完成", format_verify_report(results))
+
     def closeEvent(self, event):
         """窗口关闭事件"""
         self.stop_video()
+        if self.verify_thread:
+            self.verify_thread.requestInterruption()
+            self.verify_thread.wait()
+        if self.vinfo_loader:
+            self.vinfo_loader.requestInterruption()
+            self.vinfo_loader.wait()
+        if self.sweep_thread:
+            self.sweep_thread.wait()
+        if self.service_events:
+            self.service_events.stop()
+        try:
+            registry.export_to_file(self.metrics_file)
+        except Exception as e:
+            print(f"导出指标失败: {e}")
         event.accept()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    timer = None
+    if startup_timing_enabled():
+        timer = StartupTimer(app, STARTUP_TIME, expected=('first_paint', 'list_loaded'))
+        timer.mark('imports_done')
+    start_http_server_from_env()
     window = PlayerWindow()
+    if timer:
+        # list_scanned：列表已显示（只有文件名和大小），list_loaded：.vinfo 信息全部读取完成
+        window.list_scanned.connect(lambda: timer.mark('list_scanned'))
+        window.list_loaded.connect(lambda: timer.mark('list_loaded'))
     window.show()
+    if timer:
+        timer.mark('window_shown')
     sys.exit(app.exec())
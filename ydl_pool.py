@@ -0,0 +1,148 @@
+"""yt_dlp 延迟加载与 YoutubeDL 实例池
+
+每次下载都新建 YoutubeDL 会丢掉它的 HTTP 连接池、cookie、解析器实例以及缓存的
+播放器/签名数据，批量下载短视频时这些初始化和重复的 TLS 握手占了大部分时间。
+这里按选项组合（profile）保留空闲的 YoutubeDL 实例，下载时借出、结束后归还。
+
+每个任务不同的选项（输出模板、进度回调、后处理回调）不参与 profile 的计算：
+实例创建时注册转发回调，借出时再换成当前任务的回调和输出模板。
+同一个实例同一时间只会借给一个任务。
+"""
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import registry
+
+# 每个任务各自设置、不参与 profile 计算的选项
+PER_JOB_OPTIONS = ('outtmpl', 'progress_hooks', 'postprocessor_hooks')
+
+# yt_dlp 会加载数百个解析器模块，由调用方决定何时导入
+yt_dlp = None
+yt_dlp_lock = threading.Lock()
+
+def load_yt_dlp():
+    """导入并返回 yt_dlp 模块，多个线程同时调用时只导入一次"""
+    global yt_dlp
+    if yt_dlp is None:
+        with yt_dlp_lock:
+            if yt_dlp is None:
+                with registry.span('startup.import_yt_dlp'):
+                    import yt_dlp as module
+                yt_dlp = module
+    return yt_dlp
+
+def profile_key(ydl_opts):
+    """根据与任务无关的选项生成 profile 键"""
+    shared = {k: v for k, v in ydl_opts.items() if k not in PER_JOB_OPTIONS}
+    return json.dumps(shared, sort_keys=True, default=repr)
+
+class PooledYoutubeDL:
+    """池中的一个 YoutubeDL 实例及其当前任务的回调"""
+
+    def __init__(self, ydl_opts):
+        self.progress_hooks = []
+        self.postprocessor_hooks = []
+        opts = {k: v for k, v in ydl_opts.items() if k not in PER_JOB_OPTIONS}
+        opts['progress_hooks'] = [self.dispatch_progress]
+        opts['postprocessor_hooks'] = [self.dispatch_postprocessor]
+        self.ydl = load_yt_dlp().YoutubeDL(opts)
+
+    def dispatch_progress(self, d):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def dispatch_postprocessor(self, d):
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+    def bind(self, ydl_opts):
+        """换成当前任务的输出模板和回调"""
+        self.progress_hooks = list(ydl_opts.get('progress_hooks', []))
+        self.postprocessor_hooks = list(ydl_opts.get('postprocessor_hooks', []))
+        # YoutubeDL 初始化时把输出模板整理成 {类型: 模板} 字典
+        outtmpl = ydl_opts.get('outtmpl')
+        if isinstance(outtmpl, dict):
+            self.ydl.params['outtmpl'].update(outtmpl)
+        elif outtmpl:
+            self.ydl.params['outtmpl']['default'] = outtmpl
+
+    def unbind(self):
+        self.progress_hooks = []
+        self.postprocessor_hooks = []
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            print(f"关闭YoutubeDL实例失败: {e}")
+
+class YoutubeDLPool:
+    """按 profile 缓存空闲的 YoutubeDL 实例"""
+
+    def __init__(self, max_idle_per_profile=4, max_profiles=8):
+        self.max_idle_per_profile = max_idle_per_profile
+        self.max_profiles = max_profiles
+        self.idle = OrderedDict()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, ydl_opts):
+        """借出一个已绑定当前任务选项的 YoutubeDL 实例
+
+        任务出错时实例直接关闭，不放回池中，避免残留的状态影响之后的任务。
+        """
+        key = profile_key(ydl_opts)
+        pooled = self.take_idle(key)
+        if pooled is None:
+            registry.inc('ydl_pool_misses_total')
+            pooled = PooledYoutubeDL(ydl_opts)
+        else:
+            registry.inc('ydl_pool_hits_total')
+
+        pooled.bind(ydl_opts)
+        try:
+            yield pooled.ydl
+        except BaseException:
+            pooled.close()
+            raise
+        pooled.unbind()
+        self.release(key, pooled)
+
+    def take_idle(self, key):
+        with self.lock:
+            instances = self.idle.get(key)
+            if not instances:
+                return None
+            self.idle.move_to_end(key)
+            registry.gauge_add('ydl_pool_idle', -1)
+            return instances.pop()
+
+    def release(self, key, pooled):
+        evicted = []
+        with self.lock:
+            instances = self.idle.setdefault(key, [])
+            self.idle.move_to_end(key)
+            if len(instances) < self.max_idle_per_profile:
+                instances.append(pooled)
+                registry.gauge_add('ydl_pool_idle', 1)
+            else:
+                evicted.append(pooled)
+            # 超出 profile 数量时关闭最久未使用的 profile
+            while len(self.idle) > self.max_profiles:
+                _, old_instances = self.idle.popitem(last=False)
+                registry.gauge_add('ydl_pool_idle', -len(old_instances))
+                evicted.extend(old_instances)
+        for old in evicted:
+            old.close()
+
+    def clear(self):
+        """关闭所有空闲实例"""
+        with self.lock:
+            instances = [pooled for items in self.idle.values() for pooled in items]
+            self.idle.clear()
+            registry.gauge_set('ydl_pool_idle', 0)
+        for pooled in instances:
+            pooled.close()
+
+ydl_pool = YoutubeDLPool()
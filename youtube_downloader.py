@@ -1,3 +1,5 @@
+import time
+STARTUP_TIME = time.perf_counter()
 import sys
 import os
 import json
@@ -5,84 +7,88 @@ import webbrowser
 from datetime import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QLineEdit, QPushButton, QTextEdit,
-                           QComboBox, QLabel, QMessageBox, QFileDialog)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-import yt_dlp
+                           QComboBox, QLabel, QMessageBox, QFileDialog,
+                           QTreeWidget, QTreeWidgetItem, QHeaderView)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from history_window import HistoryWindow
+from subscriptions_window import SubscriptionsWindow
+from diagnostics_window import DiagnosticsWindow
+from metrics import registry, start_http_server_from_env
+from download_errors import ERROR_CATEGORY_NAMES
+from startup_timing import StartupTimer, FirstPaintHook, startup_timing_enabled
+from service_client import DownloadServiceClient, ServiceError
+from service_events import ServiceEventThread
+from ydl_pool import load_yt_dlp, ydl_pool
+from app_config import load_config
+from download_job import DownloadJob, DOWNLOAD_MODES
+from subscriptions import SubscriptionPoller, group_jobs
+from history_store import append_history
+from content_cache import client_from_config
+
+class YtDlpWarmupThread(QThread):
+    """后台预加载 yt_dlp，避免第一次下载时才等待导入"""
+    ready = pyqtSignal()
 
-class DownloadThread(QThread):
-    """下载线程，处理视频下载过程"""
-    progress = pyqtSignal(str)
-    finished = pyqtSignal(dict)
+    def run(self):
+        try:
+            load_yt_dlp()
+        except Exception as e:
+            print(f"预加载yt_dlp失败: {e}")
+        self.ready.emit()
+
+class SubscriptionPollThread(QThread):
+    """在后台检查频道订阅
+
+    连接了下载服务时由服务检查并提交任务，否则在本进程中检查，新视频通过 found 信号返回。
+    """
+    found = pyqtSignal(list)
+    submitted = pyqtSignal(int)
     error = pyqtSignal(str)
 
-    def __init__(self, url, download_dir, resolution='1080p'):
+    def __init__(self, poller, force=False, service_client=None):
         super().__init__()
-        self.url = url
-        self.download_dir = download_dir
-        self.resolution = resolution
-        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.poller = poller
+        self.force = force
+        self.service_client = service_client
 
     def run(self):
         try:
-            # 设置下载选项
-            ydl_opts = {
-                'format': f'bestvideo[height<={self.resolution[:-1]}]+bestaudio/best',
-                'outtmpl': os.path.join(
-                    self.download_dir,
-                    f'%(title)s_{self.timestamp}.%(ext)s'
-                ),
-                'progress_hooks': [self.progress_hook],
-                'merge_output_format': 'mp4',
-            }
-
-            # 开始下载
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(self.url, download=True)
-                
-                # 准备视频信息
-                video_info = {
-                    'title': info['title'],
-                    'url': self.url,
-                    'download_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'resolution': self.resolution,
-                    'duration': info.get('duration'),
-                    'format': info.get('format'),
-                    'channel': info.get('channel', 'Unknown'),
-                    'channel_url': info.get('channel_url', ''),
-                    'description': info.get('description', ''),
-                    'view_count': info.get('view_count'),
-                    'like_count': info.get('like_count'),
-                    'upload_date': info.get('upload_date')
-                }
-
-                # 视频文件路径
-                video_path = os.path.join(
-                    self.download_dir,
-                    f"{info['title']}_{self.timestamp}.mp4"
-                )
-
-                # 创建同名的.vinfo文件
-                vinfo_path = video_path.rsplit('.', 1)[0] + '.vinfo'
-                with open(vinfo_path, 'w', encoding='utf-8') as f:
-                    json.dump(video_info, f, ensure_ascii=False, indent=2)
-
-                # 发送完成信号
-                result = video_info.copy()
-                result['file_path'] = video_path
-                result['vinfo_path'] = vinfo_path
-                self.finished.emit(result)
-
+            if self.service_client:
+                # 第一次检查新订阅时需要列出整个频道，不使用默认的短超时
+                client = DownloadServiceClient(self.service_client.socket_path, timeout=None)
+                self.submitted.emit(len(client.poll_subscriptions()))
+            else:
+                self.found.emit(self.poller.poll(self.force))
         except Exception as e:
             self.error.emit(str(e))
 
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            progress = d.get('_percent_str', '0%')
-            speed = d.get('_speed_str', 'N/A')
-            self.progress.emit(f'下载进度: {progress} 速度: {speed}')
-        elif d['status'] == 'finished':
-            self.progress.emit('下载完成，正在处理...')
+class DownloadThread(QThread):
+    """在 QThread 中运行 DownloadJob，把回调转换为信号
+
+    参数与 DownloadJob 相同；信号在界面线程中处理。
+    """
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
+    failed = pyqtSignal(dict)
+    batch_done = pyqtSignal()
+
+    def __init__(self, url, download_dir, resolution='1080p', mode='video',
+                 scratch_dir='', reserve_margin=0, content_cache=None):
+        super().__init__()
+        self.job = DownloadJob(
+            url, download_dir, resolution, mode,
+            scratch_dir=scratch_dir, reserve_margin=reserve_margin, content_cache=content_cache,
+            on_progress=self.progress.emit, on_finished=self.finished.emit,
+            on_error=self.error.emit, on_failed=self.failed.emit, on_batch_done=self.batch_done.emit,
+        )
+
+    def run(self):
+        self.job.run()
+
+    def cancel(self):
+        self.job.cancel()
+        self.requestInterruption()
 
 class DownloaderWindow(QMainWindow):
     """下载器主窗口"""
@@ -90,7 +96,29 @@ class DownloaderWindow(QMainWindow):
         super().__init__()
         self.download_thread = None
         self.history_file = 'data/history.json'
+        self.metrics_file = 'data/metrics_downloader.prom'
+        self.config = load_config()
+        self.content_cache = client_from_config(self.config)
+        self.service_client = None
+        self.service_events = None
+        self.service_jobs = set()
+        # 下载进行中时排队的批量任务 [(链接列表, 保存位置, 分辨率, 模式)]
+        self.pending_batches = []
+        self.poller = SubscriptionPoller(self.config['subscriptions'])
+        self.poll_thread = None
+        self.subscriptions_dialog = None
         self.setup_ui()
+        self.attach_to_service()
+
+        # 定期检查订阅是否到期（连接了下载服务时由服务检查）
+        self.subscription_timer = QTimer(self)
+        self.subscription_timer.timeout.connect(self.poll_subscriptions)
+        self.subscription_timer.start(60000)
+
+        # 定期导出运行指标
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.export_metrics)
+        self.metrics_timer.start(10000)
 
     def setup_ui(self):
         """设置UI界面"""
@@ -108,7 +136,7 @@ class DownloaderWindow(QMainWindow):
         url_layout = QHBoxLayout()
         url_label = QLabel("视频URL:")
         self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText("输入YouTube视频URL")
+        self.url_input.setPlaceholderText("输入YouTube视频URL，多个URL用空格分隔可批量下载")
         url_layout.addWidget(url_label)
         url_layout.addWidget(self.url_input)
         layout.addLayout(url_layout)
@@ -125,6 +153,16 @@ class DownloaderWindow(QMainWindow):
         resolution_layout.addWidget(self.resolution_combo)
         controls_layout.addLayout(resolution_layout)
 
+        # 下载模式选择
+        mode_layout = QHBoxLayout()
+        mode_label = QLabel("模式:")
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(list(DOWNLOAD_MODES.keys()))
+        self.mode_combo.currentTextChanged.connect(self.on_mode_changed)
+        mode_layout.addWidget(mode_label)
+        mode_layout.addWidget(self.mode_combo)
+        controls_layout.addLayout(mode_layout)
+
         # 下载目录选择
         self.download_dir = os.path.join(os.getcwd(), 'downloads')
         if not os.path.exists(self.download_dir):
@@ -145,6 +183,11 @@ class DownloaderWindow(QMainWindow):
         self.download_button.clicked.connect(self.start_download)
         controls_layout.addWidget(self.download_button)
 
+        self.cancel_button = QPushButton("取消下载")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_download)
+        controls_layout.addWidget(self.cancel_button)
+
         layout.addLayout(controls_layout)
 
         # 进度显示
@@ -153,6 +196,30 @@ class DownloaderWindow(QMainWindow):
         self.progress_text.setMaximumHeight(150)
         layout.addWidget(self.progress_text)
 
+        # 失败列表（不弹出对话框，批量下载时可以无人值守）
+        self.failures_label = QLabel("失败列表:")
+        layout.addWidget(self.failures_label)
+
+        self.failure_list = QTreeWidget()
+        self.failure_list.setHeaderLabels(["视频URL", "错误类型", "尝试次数", "原因"])
+        self.failure_list.setMaximumHeight(150)
+        header = self.failure_list.header()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.failure_list)
+
+        failure_buttons_layout = QHBoxLayout()
+        failure_buttons_layout.addStretch()
+        self.retry_failed_button = QPushButton("重试失败项")
+        self.retry_failed_button.clicked.connect(self.retry_failed)
+        failure_buttons_layout.addWidget(self.retry_failed_button)
+        self.clear_failed_button = QPushButton("清空失败列表")
+        self.clear_failed_button.clicked.connect(self.failure_list.clear)
+        failure_buttons_layout.addWidget(self.clear_failed_button)
+        layout.addLayout(failure_buttons_layout)
+
         # 底部按钮区域
         bottom_layout = QHBoxLayout()
         
@@ -169,6 +236,16 @@ class DownloaderWindow(QMainWindow):
         self.history_button.clicked.connect(self.show_history)
         bottom_layout.addWidget(self.history_button)
 
+        # 订阅按钮
+        self.subscriptions_button = QPushButton("频道订阅")
+        self.subscriptions_button.clicked.connect(self.show_subscriptions)
+        bottom_layout.addWidget(self.subscriptions_button)
+
+        # 诊断按钮
+        self.diagnostics_button = QPushButton("诊断")
+        self.diagnostics_button.clicked.connect(self.show_diagnostics)
+        bottom_layout.addWidget(self.diagnostics_button)
+
         layout.addLayout(bottom_layout)
 
         # 设置样式
@@ -206,21 +283,56 @@ class DownloaderWindow(QMainWindow):
             self.download_dir = dir_path
             self.dir_display.setText(dir_path)
 
+    def on_mode_changed(self, mode_text):
+        """切换下载模式，仅视频模式需要选择分辨率"""
+        self.resolution_combo.setEnabled(DOWNLOAD_MODES[mode_text] == 'video')
+
     def start_download(self):
         """开始下载"""
-        url = self.url_input.text().strip()
-        if not url:
+        urls = self.url_input.text().split()
+        if not urls:
             QMessageBox.warning(self, "错误", "请输入视频URL")
             return
+        self.start_batch(urls)
+
+    def start_batch(self, urls, download_dir=None, resolution=None, mode=None):
+        """启动一批链接的下载，未指定的选项使用界面上的设置
+
+        本地下载正在进行时加入队列，当前批次完成后再开始。
+        """
+        download_dir = download_dir or self.download_dir
+        resolution = resolution or self.resolution_combo.currentText()
+        mode = mode or DOWNLOAD_MODES[self.mode_combo.currentText()]
+        if self.download_thread and self.download_thread.isRunning():
+            self.pending_batches.append((urls, download_dir, resolution, mode))
+            self.progress_text.append(f"已加入队列: {len(urls)} 个链接")
+            return
 
         self.download_button.setEnabled(False)
+        self.retry_failed_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
         self.progress_text.clear()
-        resolution = self.resolution_combo.currentText()
 
-        self.download_thread = DownloadThread(url, self.download_dir, resolution)
+        if self.service_client:
+            try:
+                job_ids = self.service_client.submit(urls, download_dir, resolution, mode)
+                self.service_jobs.update(job_ids)
+                self.progress_text.append(f"已提交 {len(job_ids)} 个任务到下载服务")
+                return
+            except ServiceError as e:
+                self.progress_text.append(f"下载服务不可用，改为本地下载: {str(e)}")
+                self.detach_from_service()
+
+        self.download_thread = DownloadThread(
+            urls, download_dir, resolution, mode,
+            scratch_dir=self.config['scratch_dir'],
+            reserve_margin=self.config['disk_reserve_margin_mb'] * 1024 * 1024,
+            content_cache=self.content_cache,
+        )
         self.download_thread.progress.connect(self.update_progress)
         self.download_thread.finished.connect(self.download_finished)
-        self.download_thread.error.connect(self.download_error)
+        self.download_thread.failed.connect(self.download_failed)
+        self.download_thread.batch_done.connect(self.batch_finished)
         self.download_thread.start()
 
     def update_progress(self, message):
@@ -229,39 +341,201 @@ class DownloaderWindow(QMainWindow):
 
     def download_finished(self, result):
         """下载完成处理"""
-        self.download_button.setEnabled(True)
-        self.progress_text.append("下载完成！")
+        self.progress_text.append(f"下载完成: {result['title']}")
         self.save_to_history(result)
-
-    def download_error(self, error_message):
-        """下载错误处理"""
+        self.poller.mark_downloaded(result['url'])
+
+    def download_failed(self, failure):
+        """下载失败处理：加入失败列表，不打断批量下载"""
+        category_name = ERROR_CATEGORY_NAMES[failure['category']]
+        self.progress_text.append(f"下载失败 [{category_name}]: {failure['url']}")
+        self.poller.mark_failed(failure['url'])
+        item = QTreeWidgetItem([
+            failure['url'], category_name, str(failure['attempts']), failure['message']
+        ])
+        item.setToolTip(3, failure['message'])
+        # 记下失败时的下载选项，重试时不使用界面上当前的选项
+        item.setData(0, Qt.ItemDataRole.UserRole, {
+            'url': failure['url'],
+            'download_dir': failure.get('download_dir') or self.download_dir,
+            'resolution': failure.get('resolution') or self.resolution_combo.currentText(),
+            'mode': failure.get('mode') or DOWNLOAD_MODES[self.mode_combo.currentText()],
+        })
+        self.failure_list.addTopLevelItem(item)
+
+    def batch_finished(self):
+        """全部链接处理完毕"""
         self.download_button.setEnabled(True)
-        QMessageBox.critical(self, "错误", f"下载失败: {error_message}")
+        self.retry_failed_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        failed_count = self.failure_list.topLevelItemCount()
+        if failed_count:
+            self.progress_text.append(f"下载完成！失败 {failed_count} 个，见失败列表")
+        else:
+            self.progress_text.append("下载完成！")
+        if self.pending_batches and not self.service_jobs:
+            # 等本批次的线程完全退出后再开始下一批
+            QTimer.singleShot(0, self.start_next_batch)
+
+    def cancel_download(self):
+        """取消正在进行和排队的下载，包括已提交到下载服务的任务"""
+        self.pending_batches.clear()
+        if self.service_client:
+            for job_id in list(self.service_jobs):
+                try:
+                    self.service_client.cancel(job_id)
+                except ServiceError as e:
+                    self.progress_text.append(f"取消任务失败: {str(e)}")
+        if self.download_thread and self.download_thread.isRunning():
+            self.download_thread.cancel()
+        self.cancel_button.setEnabled(False)
+        self.progress_text.append("正在取消下载...")
+
+    def start_next_batch(self):
+        if self.download_thread and self.download_thread.isRunning():
+            self.download_thread.wait()
+        if self.pending_batches:
+            self.start_batch(*self.pending_batches.pop(0))
+
+    def retry_failed(self):
+        """重新下载失败列表中的链接，按各自失败时的保存位置、分辨率和模式分批"""
+        jobs = [
+            self.failure_list.topLevelItem(i).data(0, Qt.ItemDataRole.UserRole)
+            for i in range(self.failure_list.topLevelItemCount())
+        ]
+        if not jobs:
+            return
+        self.failure_list.clear()
+        for download_dir, resolution, mode, urls in group_jobs(jobs):
+            self.start_batch(urls, download_dir, resolution, mode)
 
     def save_to_history(self, download_info):
         """保存下载历史"""
-        os.makedirs('data', exist_ok=True)
-        history = []
-        if os.path.exists(self.history_file):
+        # 下载服务、历史窗口可能同时改写历史文件，通过文件锁互斥
+        with registry.span('history.save'):
             try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
+                append_history(self.history_file, download_info)
             except Exception as e:
-                self.progress_text.append(f"读取历史记录失败: {str(e)}")
-        
-        history.append(download_info)
-        
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.progress_text.append(f"保存历史记录失败: {str(e)}")
+                self.progress_text.append(f"保存历史记录失败: {str(e)}")
 
     def show_history(self):
         """显示历史窗口"""
         history_dialog = HistoryWindow(self.history_file)
         history_dialog.exec()
 
+    def show_subscriptions(self):
+        """显示订阅管理窗口"""
+        self.subscriptions_dialog = SubscriptionsWindow(
+            self.download_dir,
+            self.resolution_combo.currentText(),
+            DOWNLOAD_MODES[self.mode_combo.currentText()],
+        )
+        self.subscriptions_dialog.check_requested.connect(lambda: self.poll_subscriptions(force=True))
+        self.subscriptions_dialog.exec()
+        self.subscriptions_dialog = None
+
+    def poll_subscriptions(self, force=False):
+        """检查订阅，force 为 False 时只检查到期的订阅"""
+        if self.poll_thread and self.poll_thread.isRunning():
+            return
+        if self.service_client and not force:
+            # 下载服务会自己定期检查
+            return
+        self.poll_thread = SubscriptionPollThread(self.poller, force, self.service_client)
+        self.poll_thread.found.connect(self.subscriptions_found)
+        self.poll_thread.submitted.connect(
+            lambda count: self.progress_text.append(f"下载服务检查了订阅，提交了 {count} 个任务")
+        )
+        self.poll_thread.error.connect(
+            lambda message: self.progress_text.append(f"检查订阅失败: {message}")
+        )
+        self.poll_thread.finished.connect(self.subscriptions_checked)
+        self.poll_thread.start()
+
+    def subscriptions_found(self, jobs):
+        """订阅中的新视频按保存位置和下载选项分批下载"""
+        if not jobs:
+            return
+        self.progress_text.append(f"订阅中发现 {len(jobs)} 个新视频")
+        for download_dir, resolution, mode, urls in group_jobs(jobs):
+            self.start_batch(urls, download_dir, resolution, mode)
+
+    def subscriptions_checked(self):
+        if self.subscriptions_dialog:
+            self.subscriptions_dialog.load_subscriptions()
+
+    def show_diagnostics(self):
+        """显示诊断面板"""
+        diagnostics_dialog = DiagnosticsWindow(self.metrics_file)
+        diagnostics_dialog.exec()
+
+    def export_metrics(self):
+        """导出运行指标到文件"""
+        try:
+            registry.export_to_file(self.metrics_file)
+        except Exception as e:
+            print(f"导出指标失败: {e}")
+
+    def attach_to_service(self):
+        """如果本地下载服务正在运行，则作为客户端连接"""
+        client = DownloadServiceClient()
+        if not client.available():
+            return
+        self.service_client = client
+        self.service_events = ServiceEventThread(client)
+        self.service_events.event.connect(self.on_service_event)
+        self.service_events.disconnected.connect(self.detach_from_service)
+        self.service_events.start()
+        self.setWindowTitle("YouTube视频下载器（已连接下载服务）")
+
+    def detach_from_service(self):
+        """与下载服务断开，之后的下载在本进程中进行"""
+        self.service_client = None
+        if self.service_events:
+            self.service_events.stop()
+            self.service_events = None
+        if self.service_jobs:
+            self.service_jobs.clear()
+            self.batch_finished()
+        self.setWindowTitle("YouTube视频下载器")
+
+    def on_service_event(self, event):
+        """处理下载服务推送的事件，只关心本窗口提交的任务"""
+        job_id = event.get('job_id')
+        if job_id not in self.service_jobs:
+            return
+
+        if event['type'] == 'progress':
+            self.update_progress(event['message'])
+            return
+        if event['type'] == 'finished':
+            # 历史记录已由下载服务保存
+            self.progress_text.append(f"下载完成: {event['result']['title']}")
+        elif event['type'] == 'failed':
+            self.download_failed(event['failure'])
+        else:
+            return
+
+        self.service_jobs.discard(job_id)
+        if not self.service_jobs:
+            self.batch_finished()
+
+    def closeEvent(self, event):
+        """窗口关闭事件"""
+        if self.download_thread and self.download_thread.isRunning():
+            self.download_thread.cancel()
+            self.download_thread.wait()
+        self.pending_batches.clear()
+        if self.poll_thread:
+            self.poll_thread.wait()
+        if self.service_events:
+            # 已提交到下载服务的任务会继续在服务中完成
+            self.service_events.disconnected.disconnect(self.detach_from_service)
+            self.service_events.stop()
+        ydl_pool.clear()
+        self.export_metrics()
+        event.accept()
+
     def open_download_dir(self):
         """打开下载目录"""
         try:
@@ -275,6 +549,21 @@ class DownloaderWindow(QMainWindow):
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    timer = None
+    if startup_timing_enabled():
+        timer = StartupTimer(app, STARTUP_TIME, expected=('first_paint', 'yt_dlp_ready'))
+        timer.mark('imports_done')
+    start_http_server_from_env()
     window = DownloaderWindow()
+
+    # 首次绘制之后再开始预加载 yt_dlp（singleShot(0) 可能在第一次绘制之前执行）
+    warmup_thread = YtDlpWarmupThread()
+    if timer:
+        warmup_thread.ready.connect(lambda: timer.mark('yt_dlp_ready'))
+    first_paint_hook = FirstPaintHook(window, warmup_thread.start)
     window.show()
-    sys.exit(app.exec())
+    if timer:
+        timer.mark('window_shown')
+    exit_code = app.exec()
+    warmup_thread.wait()
+    sys.exit(exit_code)